@@ -0,0 +1,527 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from collections import deque
+import ctypes
+import ctypes.util
+from math import sqrt
+import os
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+# Import from our module
+from .instrumentation import Histogram, registry
+
+'''
+Acquiring data from a load frame
+
+Nothing in this module depends on Gtk so acquisition can be run headless
+e.g. for benchmarking.
+
+At a fixed rate polls are scheduled on a grid of absolute deadlines, one
+polling interval apart, rather than an interval after the previous poll so
+time spent polling doesn't accumulate as drift. How far each poll starts
+after its deadline and how far each interval is from the one requested are
+kept in histograms.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class RateMeter:
+    '''
+    Measure the rate at which samples are acquired and how regular the
+    interval between them is over a sliding window of recent samples
+    '''
+
+    def __init__(self, window=200):
+        '''
+        Parameters
+        --------
+        window : int
+            the number of most recent sample intervals to consider
+        '''
+        self._intervals = deque(maxlen=window)
+        self._sum = 0.0
+        self._sum_of_squares = 0.0
+        self._last_time = None
+
+
+    def __len__(self):
+        '''
+        The number of intervals currently in the window
+        '''
+        return len(self._intervals)
+
+
+    def record(self, time):
+        '''
+        Record that a sample was taken
+
+        Parameters
+        --------
+        time : float
+            the time, as from time.monotonic(), at which the sample was taken
+        '''
+        if self._last_time is not None:
+            interval = time - self._last_time
+            if len(self._intervals) == self._intervals.maxlen:
+                oldest = self._intervals[0]
+                self._sum -= oldest
+                self._sum_of_squares -= oldest * oldest
+            self._intervals.append(interval)
+            self._sum += interval
+            self._sum_of_squares += interval * interval
+        self._last_time = time
+
+
+    def reset(self):
+        '''
+        Forget all recorded samples e.g. after the sampling rate is changed
+        '''
+        self._intervals.clear()
+        self._sum = 0.0
+        self._sum_of_squares = 0.0
+        self._last_time = None
+
+
+    def rate(self):
+        '''
+        Get the achieved sampling rate in samples per second or 0 if too few
+        samples have been recorded
+        '''
+        if not self._intervals or 0 >= self._sum:
+            return 0.0
+        return len(self._intervals) / self._sum
+
+
+    def jitter(self):
+        '''
+        Get the standard deviation of the interval between samples in seconds
+        '''
+        count = len(self._intervals)
+        if 2 > count:
+            return 0.0
+        mean = self._sum / count
+        # guard against tiny negative values from floating point error
+        return sqrt(max(0.0, self._sum_of_squares / count - mean * mean))
+
+
+# bucket bounds in seconds for how late polls start and, either side of 0,
+# for how far intervals are from the polling interval
+lateness_bounds = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+interval_error_bounds = tuple(-bound for bound in reversed(lateness_bounds)) + (0.0,) + lateness_bounds
+
+
+class DeadlineScheduler:
+    '''
+    Produce a grid of absolute deadlines one interval apart
+
+    When a poll overruns past the next deadline the policy decides what
+    happens: SKIP drops the missed deadlines so the next poll is on the grid,
+    CATCH_UP polls immediately for each missed deadline until back on time,
+    or skips once more than catch_up_limit deadlines have been missed.
+    '''
+
+    SKIP = "skip"
+    CATCH_UP = "catch_up"
+
+    catch_up_limit = 10
+
+
+    def __init__(self, interval, policy=SKIP, start=None):
+        self.interval = interval
+        self.policy = policy
+        self.overruns = 0
+        self.skipped = 0
+        self.deadline = monotonic() if start is None else start
+
+
+    def reset(self, interval=None, start=None):
+        '''
+        Start a new grid e.g. when the interval changes
+        '''
+        if interval is not None:
+            self.interval = interval
+        self.deadline = monotonic() if start is None else start
+
+
+    def advance(self, now):
+        '''
+        Move to the next deadline once a poll has finished
+
+        Parameters
+        --------
+        now : float
+            the time, as from time.monotonic(), the poll finished
+
+        Returns
+        --------
+        float - the deadline of the next poll
+        '''
+        self.deadline += self.interval
+        if now > self.deadline:
+            self.overruns += 1
+            missed = int((now - self.deadline) / self.interval) + 1
+            if self.SKIP == self.policy or missed > self.catch_up_limit:
+                self.skipped += missed
+                self.deadline += missed * self.interval
+        return self.deadline
+
+
+def enable_realtime(priority=10, lock_memory=False):
+    '''
+    Give the calling thread the SCHED_FIFO real time policy and optionally
+    lock the process's memory so it isn't paged out; Linux only
+
+    Usually needs root, CAP_SYS_NICE or an rtprio limit; memory locking
+    also needs a memlock limit large enough for the whole process including
+    run data still to be collected.
+
+    Returns
+    --------
+    str - None on success or why the thread couldn't be made real time
+    '''
+    if not hasattr(os, "sched_setscheduler"):
+        return "real time scheduling is not supported on this platform"
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except OSError as e:
+        return "unable to use SCHED_FIFO: {}".format(e)
+    if lock_memory:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        MCL_CURRENT, MCL_FUTURE = 1, 2
+        if 0 != libc.mlockall(MCL_CURRENT | MCL_FUTURE):
+            return "unable to lock memory: {}".format(os.strerror(ctypes.get_errno()))
+    return None
+
+
+class LatestValue:
+    '''
+    A slot holding the most recent value published by one thread for another
+    thread to pick up at its own pace e.g. the latest sample for display.
+
+    Values published between two takes are coalesced; only the last one is
+    seen by the consumer. The number of coalesced values is counted.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._value = None
+        self._pending = 0
+        self.published = 0
+        self.coalesced = 0
+
+
+    def publish(self, value):
+        '''
+        Replace the value in the slot
+        '''
+        with self._lock:
+            self._value = value
+            self._pending += 1
+            self.published += 1
+
+
+    def take(self):
+        '''
+        Get the most recent value if a value has been published since the
+        last take
+
+        Returns
+        --------
+        the value or None if nothing new has been published
+        '''
+        with self._lock:
+            if 0 == self._pending:
+                return None
+            self.coalesced += self._pending - 1
+            self._pending = 0
+            return self._value
+
+
+class Acquisition:
+    '''
+    Poll a load frame for samples in a background thread
+
+    Each sample is passed to a callback, on the polling thread, as the time
+    the sample was taken, the load in Newtons and the extension.
+
+    At a fixed rate polls are made at deadlines from a DeadlineScheduler using
+    overrun_policy. With realtime set the polling thread asks for SCHED_FIFO
+    when started; see enable_realtime.
+
+    Samples are stored at the time the load was measured. With
+    align_extension set the extension passed on is interpolated to that time
+    from consecutive extension readings.
+
+    If the load frame stops replying polling pauses, the optional state
+    callback is told the connection is DISCONNECTED and the load frame is
+    asked to reconnect every reconnect_interval seconds until it succeeds,
+    when the callback is told RECONNECTED and polling resumes.
+    '''
+
+    DISCONNECTED = "disconnected"
+    RECONNECTED = "reconnected"
+
+    # seconds between attempts to reconnect to a load frame which has
+    # stopped replying
+    reconnect_interval = 1.0
+
+
+    def __init__(self, machine, on_sample, load_scale, polling_interval=1, on_state=None):
+        '''
+        Parameters
+        --------
+        machine : loadframe.LoadFrame
+            the connected load frame to poll
+        on_sample : callable
+            invoked with (time, load, extension) for each sample
+        load_scale : float
+            multiplier converting readings from read_load to Newtons; the
+            value returned by the machine's get_load_cell_range
+        polling_interval : float
+            seconds between polls; sampling frequency = 1 / polling interval
+        on_state : callable
+            invoked on the polling thread with DISCONNECTED or RECONNECTED
+            and, for DISCONNECTED, the exception describing why
+        '''
+        self.machine = machine
+        self.on_sample = on_sample
+        self.on_state = on_state
+        self.load_scale = load_scale
+        self.polling_interval = polling_interval
+
+        # In free run mode the machine is polled back to back as fast as the
+        # serial link allows ignoring polling_interval
+        self.free_run = False
+        self.rate_meter = RateMeter()
+
+        self.overrun_policy = DeadlineScheduler.SKIP
+        self.scheduler = None
+        self.lateness_histogram = Histogram(lateness_bounds)
+        self.interval_histogram = Histogram(interval_error_bounds)
+
+        # optionally poll from a SCHED_FIFO thread; any failure to enable it
+        # is kept in realtime_error
+        self.realtime = False
+        self.lock_memory = False
+        self.realtime_error = None
+
+        # optionally estimate the extension at the instant the load was
+        # measured by interpolating between consecutive extension readings
+        self.align_extension = False
+        self._previous_sample = None
+
+        self.connected = True
+        self.disconnects = 0
+
+        self._running = False
+        self._thread = None
+        self._polling_interval_changed_condition = Condition()
+        self._schedule_changed = False
+
+
+    def start(self):
+        '''
+        Start polling in a daemon thread
+        '''
+        self._running = True
+        self._thread = Thread(target=self._poll_instrument)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        '''
+        Stop polling and wait for the polling thread to finish
+        '''
+        with self._polling_interval_changed_condition:
+            self._running = False
+            self._polling_interval_changed_condition.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+    def set_polling_interval(self, interval):
+        '''
+        Change the time between polls taking effect immediately
+        '''
+        with self._polling_interval_changed_condition:
+            self.polling_interval = interval
+            self._schedule_changed = True
+            self.rate_meter.reset()
+            self.lateness_histogram.reset()
+            self.interval_histogram.reset()
+            self._polling_interval_changed_condition.notify()
+
+
+    def set_free_run(self, free_run):
+        '''
+        Enable or disable polling as fast as the serial link allows
+        '''
+        with self._polling_interval_changed_condition:
+            self.free_run = free_run
+            self._schedule_changed = True
+            self.rate_meter.reset()
+            self.lateness_histogram.reset()
+            self.interval_histogram.reset()
+            self._polling_interval_changed_condition.notify()
+
+
+    def set_overrun_policy(self, policy):
+        '''
+        Choose what happens when a poll overruns past the next deadline;
+        DeadlineScheduler.SKIP or DeadlineScheduler.CATCH_UP
+        '''
+        with self._polling_interval_changed_condition:
+            self.overrun_policy = policy
+            if self.scheduler:
+                self.scheduler.policy = policy
+
+
+    def schedule_statistics(self):
+        '''
+        Get how well polls have kept to the grid of deadlines
+
+        Returns
+        --------
+        dict - overruns, skipped deadlines and the lateness and interval
+            error histograms, in seconds
+        '''
+        scheduler = self.scheduler
+        return {
+            "polling_interval": None if self.free_run else self.polling_interval,
+            "overrun_policy": self.overrun_policy,
+            "overruns": scheduler.overruns if scheduler else 0,
+            "skipped": scheduler.skipped if scheduler else 0,
+            "lateness": self.lateness_histogram.as_dict(),
+            "interval_error": self.interval_histogram.as_dict(),
+            "realtime_error": self.realtime_error
+        }
+
+
+    def _poll_instrument(self):
+        '''
+        Poll the load frame via serial connection for data
+
+        Intended to be run as a thread
+        '''
+        if self.realtime:
+            self.realtime_error = enable_realtime(lock_memory=self.lock_memory)
+        self.scheduler = DeadlineScheduler(self.polling_interval, self.overrun_policy)
+        self._schedule_changed = False
+        previous_start = None
+
+        while self._running:
+            # wait for the deadline; the condition is only held while waiting
+            with self._polling_interval_changed_condition:
+                if self._schedule_changed:
+                    self._schedule_changed = False
+                    self.scheduler.reset(self.polling_interval)
+                    previous_start = None
+                    self._previous_sample = None
+                free_run = self.free_run
+                deadline = self.scheduler.deadline
+                while not free_run and self._running and not self._schedule_changed:
+                    delay = deadline - monotonic()
+                    if 0 >= delay:
+                        break
+                    self._polling_interval_changed_condition.wait(delay)
+                if not self._running:
+                    return
+                if self._schedule_changed:
+                    continue
+
+            start = monotonic()
+            if not free_run:
+                self.lateness_histogram.record(start - deadline)
+                if start - deadline > 0.1 * self.scheduler.interval:
+                    registry.increment("acquisition.late_polls")
+                if previous_start is not None:
+                    self.interval_histogram.record(start - previous_start - self.scheduler.interval)
+                previous_start = start
+
+            # poll the machine; load and extension in one round trip
+            try:
+                sample = self.machine.read_sample()
+            except (IOError, ValueError) as e:
+                if not self._reconnect(e):
+                    return
+                self._schedule_changed = True
+                continue
+            now = sample.time
+            extension = sample.extension
+            if self.align_extension:
+                extension = self._aligned_extension(sample)
+            self.rate_meter.record(now)
+            with registry.timer("acquisition.on_sample"):
+                self.on_sample(now, sample.load * self.load_scale, extension)
+            registry.increment("acquisition.samples")
+
+            if not free_run:
+                self.scheduler.advance(monotonic())
+
+
+    def _aligned_extension(self, sample):
+        '''
+        Get the extension at the sample's load_time, interpolated between
+        the previous and this sample's extension readings when load_time
+        falls between them; otherwise the extension as read
+        '''
+        previous, self._previous_sample = self._previous_sample, sample
+        if (previous is None or sample.load_time is None or sample.extension_time is None
+                or previous.extension_time is None):
+            return sample.extension
+        span = sample.extension_time - previous.extension_time
+        if not previous.extension_time <= sample.load_time <= sample.extension_time or 0 >= span:
+            return sample.extension
+        fraction = (sample.load_time - previous.extension_time) / span
+        return previous.extension + (sample.extension - previous.extension) * fraction
+
+
+    def _reconnect(self, error):
+        '''
+        Reconnect to the load frame after it stopped replying
+
+        Returns
+        --------
+        bool - True once reconnected, False if stopped or the load frame
+            can't reconnect
+        '''
+        self.connected = False
+        self.disconnects += 1
+        registry.increment("acquisition.disconnects")
+        if self.on_state:
+            self.on_state(self.DISCONNECTED, error)
+        while True:
+            with self._polling_interval_changed_condition:
+                if self._running:
+                    self._polling_interval_changed_condition.wait(self.reconnect_interval)
+                if not self._running:
+                    return False
+            try:
+                self.machine.reconnect()
+            except NotImplementedError:
+                return False
+            except (IOError, LookupError, ValueError):
+                continue
+            self.connected = True
+            self.rate_meter.reset()
+            if self.on_state:
+                self.on_state(self.RECONNECTED, None)
+            return True
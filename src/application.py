@@ -9,15 +9,9 @@
 #####################################################################
 
 # Import from python stanard library
-import csv
-from random import random
 import sys
-from threading import Condition, Lock, Thread
-from time import monotonic, sleep
-
-# Import from third party libraries
-from serial import Serial
-from serial.tools.list_ports import comports
+from threading import Lock, Thread
+from time import monotonic, time
 
 # Import from OS provided libraries e.g. python-gobject
 #   on CentOS install with `sudo dnf install python36-gobject`
@@ -26,6 +20,15 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import GLib, Gio, Gtk
 
 # Import from our bundled instrument control library
+from .acquisition import Acquisition, LatestValue
+from .autodetect import detect
+from .export import ExportJob, available_export_formats
+from .graph import GraphRenderer
+from .instrumentation import registry
+from .portdiscovery import PortWatcher
+from .recorder import StreamRecorder
+from .rundata import MappedRunData, RunData
+from .statisticswindow import StatisticsWindow
 from .tiniusolsen import TiniusOlsen1000Series, TiniusOlsenH5KSeries
 
 
@@ -52,11 +55,12 @@ class Application(Gtk.Application):
     Tom Egan <tom@tomegan.tech>
     '''
 
-    # the minimum time to delay between consecutive polls of instrument
-    # ideally 0 would be a safe value but in priciple we need a bit more
-    # time to account for processing overhead. This implies a maximum
-    # sampling frequency of 1/minimal_delay e.g. 100 Hz => 0.01
-    minimal_delay = 0.005
+    # how often, in seconds, to refresh the achieved sampling rate display
+    rate_display_interval = 1
+
+    # how many times per second to refresh the load and extension fields and
+    # the graph; independent of the sampling rate
+    display_rate = 30
 
     # Dictionary of supported models. The keys are used in the UI to populate
     # the model selection combobox. The values must be concrete implementations
@@ -83,10 +87,11 @@ class Application(Gtk.Application):
 
         # declare a reference to the apparatus
         self.machine = None
+        self.model_name = None
         self.range = 0
 
-        # declare a reference to the thread we will use to poll the machine
-        self.instrument_control_thread = None
+        # declare a reference to the worker we will use to poll the machine
+        self.acquisition = None
 
         # Declare a reference to a window and UI elements
         self.window = None
@@ -95,6 +100,7 @@ class Application(Gtk.Application):
         self.connection_select = None
         self.model_select = None
         self.connect_button = None
+        self.auto_detect_button = None
         self.run_button = None
         self.run_rate_field = None
         self.direction_up_radio_button = None
@@ -102,24 +108,55 @@ class Application(Gtk.Application):
         self.load_field = None
         self.extension_field = None
         self.run_rate = None
+        self.sampling_rate_field = None
+        self.acquisition_rate_label = None
+        self.export_data_button = None
 
         # Declare a reference to the list of serial devices the UI will show
-        # in the combo box on the device selection page
+        # in the combo box on the device selection page, kept up to date by
+        # a watcher as adapters are plugged in and unplugged
         self.serial_connections_list_store = None
+        self.port_watcher = None
 
         # Declare some place holder data
         self.coords = [(25.5, 38.8), (103.3, 209.9), (235.9, 132.2), (300.1, 200.5)]
 
-        # Declare a list to hold run data and a lock to control multi threaded access to it
-        self.run_data = []
+        # Declare a store to hold run data and a lock to control multi threaded access to it
+        self.run_data = RunData()
         self.__run_data_lock = Lock()
 
+        # Draws the run data onto a cached surface
+        self.graph = GraphRenderer()
+
+        # Optionally streams collected data to a file as it is acquired
+        self.recorder = None
+        self.record_action = None
+
+        # Long runs can be kept in a memory mapped file instead of memory
+        self.disk_storage_action = None
+
+        # Extension can be interpolated to the instant load was measured
+        self.align_extension_action = None
+
+        # The export, if any, writing a snapshot of the run data in the background
+        self.export_job = None
+
+        # Shows the statistics in instrumentation.registry when open
+        self.statistics_window = None
+
         # Declare a boolean to track if we should accumulate data
         self.__collecting_data = False
 
         # Set a sane default: 1 Hz
         self.polling_interval = 1 # sampling frequency = 1 / polling interval
-        self.__polling_interval_changed_condition = Condition()
+        self.free_run = False
+        self.__next_rate_display = 0
+
+        # The acquisition thread publishes samples here and a timer on the
+        # main loop picks up the latest one display_rate times per second
+        self.latest_sample = LatestValue()
+        self.__display_timer = None
+        self.__drawn_length = 0
 
         # Add command line parsing options
         #self.add_main_option("log", ord("l"), GLib.OptionFlags.NONE, GLib.OptionArg.NONE, "Enable logging raw output from Load Frame", None)
@@ -150,6 +187,21 @@ class Application(Gtk.Application):
         action.connect("activate", self.ui_export_data)
         self.add_action(action)
 
+        self.record_action = Gio.SimpleAction.new_stateful("record", None,
+            GLib.Variant.new_boolean(False))
+        self.record_action.connect("activate", self.ui_toggle_recording)
+        self.add_action(self.record_action)
+
+        self.disk_storage_action = Gio.SimpleAction.new_stateful("disk_storage", None,
+            GLib.Variant.new_boolean(False))
+        self.disk_storage_action.connect("activate", self.ui_toggle_disk_storage)
+        self.add_action(self.disk_storage_action)
+
+        self.align_extension_action = Gio.SimpleAction.new_stateful("align_extension", None,
+            GLib.Variant.new_boolean(False))
+        self.align_extension_action.connect("activate", self.ui_toggle_align_extension)
+        self.add_action(self.align_extension_action)
+
         action = Gio.SimpleAction.new("quit", None)
         action.connect("activate", self.ui_quit)
         self.add_action(action)
@@ -205,9 +257,13 @@ class Application(Gtk.Application):
             self.models_list_store = builder.get_object("models_list_store")
             self.model_select = builder.get_object("model_select")
             self.connect_button = builder.get_object("connect_button")
+            self.auto_detect_button = builder.get_object("auto_detect_button")
             self.run_button = builder.get_object("run_button")
             self.run_rate_field = builder.get_object("run_rate_field")
             self.direction_up_radio_button = builder.get_object("direction_up_radio_button")
+            self.sampling_rate_field = builder.get_object("sampling_rate_field")
+            self.acquisition_rate_label = builder.get_object("acquisition_rate_label")
+            self.export_data_button = builder.get_object("export_data_button")
             
             # Pack a renderer in the connection select combobox
             renderer = Gtk.CellRendererText()
@@ -231,8 +287,16 @@ class Application(Gtk.Application):
             # Does not work from Glade for some reason
             self.graph_canvas.connect("draw", self.plot_data)
 
-            # Get a list of serial ports and populate the combobox
-            self.ui_update_serial_port_list(None)
+            # Populate the combobox with serial ports as they are found
+            self.port_watcher = PortWatcher(
+                lambda port: GLib.idle_add(self.__port_added, port),
+                lambda port: GLib.idle_add(self.__port_removed, port))
+            self.connect_button.set_sensitive(False)
+            self.port_watcher.start()
+
+            # Refresh the display at a fixed rate however fast we sample
+            self.__display_timer = GLib.timeout_add(int(1000 / self.display_rate),
+                self.__refresh_display)
 
             # we should set the run_rate and sampling_rate field here rather
             # than depend on them being in sync
@@ -241,28 +305,50 @@ class Application(Gtk.Application):
         self.window.present()
 
 
-    def ui_zero_extension(self, _sender):
+    def ui_zero_extension(self, sender):
         '''
         UI Action method; Callback invoked when the zero extension button is clicked
+
+        Some load frames take several seconds to zero; the button is
+        disabled until zeroing completes while sampling continues.
         '''
         if self.machine:
-            self.machine.zero_extension()
+            self.__zero("extension", self.machine.zero_extension_async(), sender)
         else:
             print("Unable to zero extension; No load frame connected")
             self.statusbar.push(0, "Unable to zero load; No load frame connected")
 
 
-    def ui_zero_load(self, _sender):
+    def ui_zero_load(self, sender):
         '''
         Callback invoked when the zero load button is clicked
         '''
         if self.machine:
-            self.machine.zero_load()
+            self.__zero("load", self.machine.zero_load_async(), sender)
         else:
             print("Unable to zero load; No load frame connected")
             self.statusbar.push(0, "Unable to zero load; No load frame connected")
 
 
+    def __zero(self, quantity, future, button):
+        button.set_sensitive(False)
+        self.statusbar.push(0, "Zeroing {}".format(quantity))
+        # the future may complete on another thread; report on the main loop
+        future.add_done_callback(
+            lambda future: GLib.idle_add(self.__zeroed, quantity, future, button))
+
+
+    def __zeroed(self, quantity, future, button):
+        button.set_sensitive(True)
+        error = future.exception()
+        if error:
+            print(error)
+            self.statusbar.push(0, "Unable to zero {}: {}".format(quantity, error))
+        else:
+            self.statusbar.push(0, "Zeroed {}".format(quantity))
+        return False
+
+
     def ui_sample_rate_changed(self, sender):
         try:
             # We set limits in the sampling_rate_adjustment in the window.glade
@@ -270,14 +356,24 @@ class Application(Gtk.Application):
             # could end in a div by 0 exception so handle before trying to
             # acquire the lock
             interval = 1 / float(sender.get_value())
-            with self.__polling_interval_changed_condition:
-                self.polling_interval = interval
-                self.__polling_interval_changed_condition.notify()
+            self.polling_interval = interval
+            if self.acquisition:
+                self.acquisition.set_polling_interval(interval)
         except Exception as e:
             print(e)
             self.statusbar.push(0, "Unable to set sampling rate; Invalid rate")
 
 
+    def ui_free_run_toggled(self, sender):
+        '''
+        UI Action method; invoked when the free run check button is toggled
+        '''
+        self.free_run = sender.get_active()
+        if self.acquisition:
+            self.acquisition.set_free_run(self.free_run)
+        self.sampling_rate_field.set_sensitive(not self.free_run)
+
+
     def ui_run_rate_changed(self, _sender):
         '''
         UI Action method; invoked when the run rate input value changes
@@ -289,6 +385,17 @@ class Application(Gtk.Application):
             self.statusbar.push(0, "Unable to set run rate; No load frame connected")
 
 
+    def ui_graph_window_changed(self, sender):
+        '''
+        UI Action method; invoked when the graph window value changes. A
+        window of 0 seconds shows the whole run.
+        '''
+        window = sender.get_value()
+        with self.__run_data_lock:
+            self.run_data.set_window(window if 0 < window else None)
+        self.graph_canvas.queue_draw()
+
+
     def ui_collect_data_state_changed(self, _sender, state):
         self.__collecting_data = state
 
@@ -301,16 +408,29 @@ class Application(Gtk.Application):
         instruct load frame to run otherwise instruct load frame to stop
         '''
         if self.machine:
-            if self.run_button.get_active():
-                self.machine.set_run_rate(self.run_rate_field.get_value())
-                if self.direction_up_radio_button.get_active():
-                    self.machine.start_moving_up()
+            try:
+                if self.run_button.get_active():
+                    self.machine.set_run_rate(self.run_rate_field.get_value())
+                    if self.direction_up_radio_button.get_active():
+                        self.machine.start_moving_up()
+                    else:
+                        self.machine.start_moving_down()
+                    self.run_button.set_label("Stop")
                 else:
-                    self.machine.start_moving_down()
-                self.run_button.set_label("Stop")
-            else:
-                self.machine.stop_moving()
-                self.run_button.set_label("Run")
+                    start = monotonic()
+                    self.machine.stop_moving()
+                    self.run_button.set_label("Run")
+                    stop_latency = self.machine.stop_latency()
+                    if stop_latency is not None:
+                        self.statusbar.push(0, "Stopped in {:.1f} ms; 99% of stops take under {:.1f} ms".format(
+                            1000 * (monotonic() - start), 1000 * stop_latency))
+            except IOError as e:
+                print(e)
+                self.statusbar.push(0, "Unable to command load frame: {}".format(e))
+                # put the button back so clicking it again retries the command
+                self.run_button.handler_block_by_func(self.ui_run_testing_apparatus)
+                self.run_button.set_active(not self.run_button.get_active())
+                self.run_button.handler_unblock_by_func(self.ui_run_testing_apparatus)
         else:
             print("Unable to run load frame; No load frame connected")
             self.statusbar.push(0, "Unable to run load frame; No load frame connected")
@@ -326,8 +446,12 @@ class Application(Gtk.Application):
 
 
     def ui_clear_data(self, *_args):
-        with self.__run_data_lock:
-            self.run_data = []
+        try:
+            with self.__run_data_lock:
+                self.run_data.clear()
+        except OSError as e:
+            print(e)
+            self.statusbar.push(0, "Unable to clear data: {}".format(e))
 
         # force redraw as data is dirty after releasing lock
         self.graph_canvas.queue_draw()
@@ -336,8 +460,16 @@ class Application(Gtk.Application):
     def ui_export_data(self, *_args):
         '''
         Run a Save dialog and if the user provides a file name, dump the
-        run data into a csv file with the specified file name
+        run data into a file of the format chosen by the dialog's filter
+
+        The file is written in the background from a snapshot of the run
+        data so acquisition and drawing continue meanwhile. If an export is
+        already running, cancel it instead.
         '''
+        if self.export_job:
+            self.export_job.cancel()
+            return
+
         dialog = Gtk.FileChooserDialog(title = "Export",
                                         parent = self.window,
                                         action = Gtk.FileChooserAction.SAVE)
@@ -345,54 +477,265 @@ class Application(Gtk.Application):
         dialog.add_button(Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
         dialog.set_current_name("trial.csv")
 
-        filter_csv = Gtk.FileFilter()
-        filter_csv.set_name("CSV files")
-        filter_csv.add_pattern("*.csv")
-        dialog.add_filter(filter_csv)
+        formats = {}
+        for export_format in available_export_formats():
+            file_filter = Gtk.FileFilter()
+            file_filter.set_name(export_format.name)
+            file_filter.add_pattern("*" + export_format.extension)
+            dialog.add_filter(file_filter)
+            formats[file_filter] = export_format
+        dialog.connect("notify::filter", self.__export_filter_changed, formats)
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
+            export_format = formats[dialog.get_filter()]
             filename = dialog.get_filename()
-            with open(filename, 'w') as csvfile:
-                with self.__run_data_lock: # wouldn't do to change data during export
-                    spamwriter = csv.writer(csvfile)
-                    spamwriter.writerow(("Time", "Load (N)", "Extension (mm)"))
-                    for row in self.run_data:
-                        spamwriter.writerow(row)
-                    print("Exported data to {}".format(filename))
-                    self.statusbar.push(0, "Exported data to {}".format(filename))
-        # can release locks before disposing of dialog.
+            if not filename.endswith(export_format.extension):
+                filename += export_format.extension
+            with self.__run_data_lock: # a snapshot won't change during export
+                run_data = self.run_data.snapshot()
+            # the job reports from its own thread; pass its reports to the main loop
+            metadata = self.__run_metadata()
+            metadata["exported"] = time()
+            self.export_job = ExportJob(run_data, filename, export_format, metadata,
+                on_progress=lambda job, fraction: GLib.idle_add(self.__export_progress, job, fraction),
+                on_finished=lambda job: GLib.idle_add(self.__export_finished, job))
+            self.export_data_button.set_label("Cancel Export")
+            self.statusbar.push(0, "Exporting data to {}".format(filename))
+            self.export_job.start()
         dialog.destroy()
 
 
+    def __export_filter_changed(self, dialog, _param, formats):
+        # keep the extension of the file name in step with the chosen format
+        export_format = formats.get(dialog.get_filter())
+        name = dialog.get_current_name()
+        if export_format is None or not name:
+            return
+        for other in formats.values():
+            if name.endswith(other.extension):
+                name = name[:-len(other.extension)]
+                break
+        dialog.set_current_name(name + export_format.extension)
+
+
+    def __run_metadata(self):
+        '''
+        Describe the run and the load frame for storing with run data
+        '''
+        metadata = {
+            "model": self.model_name,
+            "load_cell_range": self.range,
+            "run_rate": self.run_rate_field.get_value() if self.run_rate_field else None,
+            "sampling_rate": None if self.free_run else 1 / self.polling_interval,
+            "free_run": self.free_run,
+            "extension_aligned_to_load": bool(self.acquisition and self.acquisition.align_extension),
+            # add to a sample time to get seconds since the epoch
+            "time_offset": time() - monotonic()
+        }
+        # only some load frames are zeroed in software
+        for offset in ("zero_load_offset", "zero_extension_offset"):
+            if hasattr(self.machine, offset):
+                metadata[offset] = getattr(self.machine, offset)
+        return metadata
+
+
+    def __export_progress(self, job, fraction):
+        if job is self.export_job:
+            self.statusbar.pop(0)
+            self.statusbar.push(0, "Exporting data to {}: {:.0%}".format(job.filename, fraction))
+        return False
+
+
+    def __export_finished(self, job):
+        self.export_job = None
+        self.export_data_button.set_label("Export Data")
+        self.statusbar.pop(0)
+        if job.cancelled:
+            self.statusbar.push(0, "Export to {} cancelled".format(job.filename))
+        elif job.error:
+            print(job.error)
+            self.statusbar.push(0, "Unable to export data to {}: {}".format(job.filename, job.error))
+        else:
+            print("Exported data to {}".format(job.filename))
+            self.statusbar.push(0, "Exported data to {}".format(job.filename))
+        return False
+
+
     def ui_show_preferences_window(self, _action, _params):
-        print("Asked to show preferences window")
+        '''
+        Show the statistics window, from which collecting statistics about
+        the acquisition path can be switched on and off
+        '''
+        if self.statistics_window is None:
+            self.statistics_window = StatisticsWindow(self.window, self.use_bundled_resources)
+            self.statistics_window.window.connect("destroy", self.__statistics_window_closed)
+        self.statistics_window.window.show_all()
+        self.statistics_window.window.present()
+
+
+    def __statistics_window_closed(self, _window):
+        self.statistics_window = None
+
+
+    def ui_toggle_recording(self, _action, _params):
+        '''
+        Start or stop streaming collected data to a file
+
+        If not recording, run a Save dialog and if the user provides a file
+        name, append every sample collected from now on to that file. The
+        file can be converted to CSV with the recorder module even if the
+        application does not exit cleanly.
+        '''
+        if self.recorder:
+            self.__stop_recording()
+            return
+
+        dialog = Gtk.FileChooserDialog(title = "Record",
+                                        parent = self.window,
+                                        action = Gtk.FileChooserAction.SAVE)
+        dialog.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        dialog.add_button(Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        dialog.set_current_name("trial.lfr")
+
+        filter_recording = Gtk.FileFilter()
+        filter_recording.set_name("Load frame recordings")
+        filter_recording.add_pattern("*.lfr")
+        dialog.add_filter(filter_recording)
+
+        response = dialog.run()
+        if response == Gtk.ResponseType.OK:
+            filename = dialog.get_filename()
+            metadata = self.__run_metadata()
+            metadata["started"] = time()
+            try:
+                self.recorder = StreamRecorder(filename, metadata)
+                self.record_action.set_state(GLib.Variant.new_boolean(True))
+                self.statusbar.push(0, "Recording data to {}".format(filename))
+            except IOError as e:
+                print(e)
+                self.statusbar.push(0, "Unable to record data to {}".format(filename))
+        dialog.destroy()
+
+
+    def __stop_recording(self):
+        recorder = self.recorder
+        self.recorder = None
+        recorder.close()
+        self.record_action.set_state(GLib.Variant.new_boolean(False))
+        if recorder.error:
+            self.statusbar.push(0, "Recording to {} failed: {}".format(recorder.path, recorder.error))
+        else:
+            self.statusbar.push(0, "Recorded {} samples to {}".format(
+                recorder.samples_written, recorder.path))
+
+
+    def ui_toggle_align_extension(self, action, _params):
+        '''
+        Toggle estimating the extension at the instant the load was measured
+        rather than storing it as read, a serial round trip later
+        '''
+        align = not action.get_state().get_boolean()
+        action.set_state(GLib.Variant.new_boolean(align))
+        if self.acquisition:
+            self.acquisition.align_extension = align
+
+
+    def ui_toggle_disk_storage(self, action, _params):
+        '''
+        Switch between keeping run data in memory and in a memory mapped
+        file so memory use stays flat during runs lasting days
+
+        Samples collected so far are copied to the new store, mostly
+        without holding the run data lock so acquisition isn't held up.
+        '''
+        on_disk = not action.get_state().get_boolean()
+        try:
+            run_data = MappedRunData() if on_disk else RunData()
+        except OSError as e:
+            print(e)
+            self.statusbar.push(0, "Unable to keep run data on disk: {}".format(e))
+            return
+        with self.__run_data_lock:
+            snapshot = self.run_data.snapshot()
+            run_data.set_window(self.run_data.window)
+        run_data.extend(snapshot)
+        with self.__run_data_lock:
+            # and whatever arrived while copying
+            run_data.extend(self.run_data.snapshot(), len(snapshot))
+            self.run_data = run_data
+
+        action.set_state(GLib.Variant.new_boolean(on_disk))
+        self.graph.invalidate()
+        if self.graph_canvas:
+            self.graph_canvas.queue_draw()
+        if on_disk:
+            self.statusbar.push(0, "Keeping run data in {}".format(run_data.directory))
+        else:
+            self.statusbar.push(0, "Keeping run data in memory")
 
 
     def ui_quit(self, *_args):
         '''
         Callback to exit this application
         '''
+        if self.recorder:
+            self.__stop_recording()
+        if self.export_job:
+            self.export_job.cancel()
+            self.export_job.wait()
+        if self.port_watcher:
+            self.port_watcher.stop()
         self.quit()
 
 
     def ui_update_serial_port_list(self, _sender):
-        ports = comports()
-
-        self.serial_connections_list_store.clear()
-
-        if 1 > len(ports):
-            print("No ports found")
+        '''
+        UI Action method; invoked when the refresh button is clicked. Ports
+        are listed in the background and the list updated as they are found.
+        '''
+        if self.port_watcher:
+            self.port_watcher.rescan()
+
+
+    def __find_port_row(self, device):
+        for row in self.serial_connections_list_store:
+            if row[0] == device:
+                return row.iter
+        return None
+
+
+    def __port_added(self, port):
+        if self.__find_port_row(port.device) is not None:
+            return False
+        print("Found serial port {} ({})".format(port.name, port.device))
+        row = self.serial_connections_list_store.append(None)
+        self.serial_connections_list_store.set_value(row, 0, port.device)
+        self.serial_connections_list_store.set_value(row, 1, port.name)
+        if self.connection_select.get_active_iter() is None:
+            self.connection_select.set_active_iter(row)
+            # reconnecting is quicker if the model is already chosen
+            if port.last_model in self.loadframe_models and self.model_select.get_active_iter() is None:
+                for model_row in self.model_select.get_model():
+                    if model_row[0] == port.last_model:
+                        self.model_select.set_active_iter(model_row.iter)
+                        break
+        self.connect_button.set_sensitive(True)
+        self.auto_detect_button.set_sensitive(True)
+        return False
+
+
+    def __port_removed(self, port):
+        print("Serial port {} removed".format(port.device))
+        row = self.__find_port_row(port.device)
+        if row is not None:
+            self.serial_connections_list_store.remove(row)
+        if 0 == len(self.serial_connections_list_store):
             self.connect_button.set_sensitive(False)
-        else:
-            print("{} serial ports found".format(len(ports)))
-            for port in ports:
-                print("{} ({})".format(port.name, port.device))
-                row = self.serial_connections_list_store.append(None)
-                self.serial_connections_list_store.set_value(row, 0, port.device)
-                self.serial_connections_list_store.set_value(row, 1, port.name)
+            self.auto_detect_button.set_sensitive(False)
+        elif self.connection_select.get_active_iter() is None:
             self.connection_select.set_active(0)
-            self.connect_button.set_sensitive(True)
+        return False
 
 
     def ui_connect(self, _sender):
@@ -417,18 +760,8 @@ class Application(Gtk.Application):
 
             # connect to device and discover device settings...
             try:
-                self.machine = self.loadframe_models[model_name](serial_device_name)
-                self.range = self.machine.get_load_cell_range()
-
-                # show machine controls
-                self.statusbar.remove_all(0)
-                self.statusbar.push(0, "Connected to loadframe on {} range: {}N".format(serial_device_name, self.range))
-                self.panel_switcher.set_visible_child_name("control_pane")
-
-                # start polling instrument
-                self.instrument_control_thread = Thread(target=self.__poll_instrument)
-                self.instrument_control_thread.daemon = True
-                self.instrument_control_thread.start()
+                self.__use_machine(self.loadframe_models[model_name](serial_device_name),
+                                   model_name, serial_device_name)
             except:
                 self.statusbar.push(0, "Unable to establish connection to load frame controller on {}".format(serial_device_name))
         else:
@@ -436,6 +769,119 @@ class Application(Gtk.Application):
             self.statusbar.push(0, "You must select a serial port to connect to.")
 
 
+    def __use_machine(self, machine, model_name, serial_device_name):
+        '''
+        Start polling a newly connected load frame and show its controls
+        '''
+        self.machine = machine
+        self.model_name = model_name
+        self.range = self.machine.get_load_cell_range()
+        self.port_watcher.remember_model(serial_device_name, model_name)
+
+        # show machine controls
+        self.statusbar.remove_all(0)
+        self.statusbar.push(0, "Connected to loadframe on {} range: {}N".format(serial_device_name, self.range))
+        self.panel_switcher.set_visible_child_name("control_pane")
+
+        # start polling instrument
+        self.acquisition = Acquisition(self.machine, self.__sample_acquired,
+            self.range, self.polling_interval,
+            lambda state, error: GLib.idle_add(self.__connection_state_changed, state, error))
+        self.acquisition.set_free_run(self.free_run)
+        self.acquisition.align_extension = self.align_extension_action.get_state().get_boolean()
+        self.acquisition.start()
+        self.__add_statistics_sources()
+
+
+    def __add_statistics_sources(self):
+        # statistics kept by the driver and acquisition, for the statistics
+        # window; looked up each time as reconnecting replaces the transport
+        registry.add_source("link", lambda: self.machine.link_statistics())
+        registry.add_source("transport", lambda: self.machine.transport.statistics())
+        registry.add_source("schedule", lambda: self.acquisition.schedule_statistics())
+        registry.add_source("stop_latency_p99", lambda: self.machine.stop_latency())
+        registry.add_source("acquisition", lambda: {
+            "samples_per_second": self.acquisition.rate_meter.rate(),
+            "jitter": self.acquisition.rate_meter.jitter(),
+            "connected": self.acquisition.connected,
+            "disconnects": self.acquisition.disconnects
+        })
+        registry.add_source("display", lambda: {
+            "samples_published": self.latest_sample.published,
+            "samples_coalesced": self.latest_sample.coalesced,
+            "samples_stored": len(self.run_data),
+            "bytes_per_sample": self.run_data.bytes_per_sample(),
+            # excludes the file of a run kept on disk
+            "memory_bytes": self.run_data.memory_usage()
+        })
+
+
+    def __connection_state_changed(self, state, error):
+        if Acquisition.DISCONNECTED == state:
+            print(error)
+            self.statusbar.push(0, "Lost connection to load frame on {}; reconnecting".format(
+                self.machine.communication_port_name))
+            self.acquisition_rate_label.set_text("Disconnected")
+        else:
+            statistics = self.machine.link_statistics()
+            self.statusbar.push(0, "Reconnected to load frame on {} ({} timeouts, {} retries so far)".format(
+                self.machine.communication_port_name, statistics.get("timeouts"),
+                statistics.get("retries")))
+        return False
+
+
+    def ui_auto_detect(self, _sender):
+        '''
+        UI Action method; probe every serial port for a supported load frame
+        in the background and connect to the first found
+        '''
+        ports = [row[0] for row in self.serial_connections_list_store]
+        # try the model last used through each port first
+        preferred = {}
+        for device in ports:
+            port = self.port_watcher.ports.get(device)
+            if port is not None and port.last_model in self.loadframe_models:
+                preferred[device] = self.loadframe_models[port.last_model]
+
+        self.connect_button.set_sensitive(False)
+        self.auto_detect_button.set_sensitive(False)
+        self.statusbar.push(0, "Looking for load frames on {} serial ports".format(len(ports)))
+        Thread(target=lambda: GLib.idle_add(self.__auto_detected,
+                                            detect(ports, self.loadframe_models.values(), preferred)),
+               daemon=True).start()
+
+
+    def __auto_detected(self, detections):
+        self.connect_button.set_sensitive(True)
+        self.auto_detect_button.set_sensitive(True)
+        if not detections:
+            self.statusbar.push(0, "No load frame found on any serial port")
+            return False
+
+        detection = detections[0]
+        # only one load frame can be controlled at a time
+        for other in detections[1:]:
+            other.machine.close()
+        model_name = next(name for name, model in self.loadframe_models.items()
+                          if model is detection.model)
+
+        # show what was found in case the user returns to this page
+        row = self.__find_port_row(detection.port)
+        if row is not None:
+            self.connection_select.set_active_iter(row)
+        for model_row in self.model_select.get_model():
+            if model_row[0] == model_name:
+                self.model_select.set_active_iter(model_row.iter)
+                break
+
+        print("Found {} on {}".format(model_name, detection.port))
+        try:
+            self.__use_machine(detection.machine, model_name, detection.port)
+        except:
+            self.statusbar.push(0, "Unable to establish connection to load frame controller on {}".format(detection.port))
+        return False
+
+
     def plot_data(self, canvas, cr):
         '''
         Draw the graph
@@ -445,79 +891,74 @@ class Application(Gtk.Application):
             canvas - the GTKDrawingArea into which the cairo contex will will render
             cr - the cairo context to draw with
         '''
-        cr.set_source_rgb(0, 0, 0)
-        cr.set_line_width(0.5)
-        height = canvas.get_allocated_height() - 20
-        width = canvas.get_allocated_width() - 20
-
-        with self.__run_data_lock: # wouldn't do to change data during export
-            if 1 < len(self.run_data): # plotting a single point gets weird
-                # find max and min values
-                initial_point = self.run_data[0]
-                time_min = initial_point[0]
-                time_max = self.run_data[-1][0]
-                load_min = initial_point[1]
-                load_max = initial_point[1]
-                for row in self.run_data[1:]:
-                    # We know time is monotonic so we can just look and first and last
-                    # if row[0] < time_min:
-                    #     time_min = row[0]
-                    # if row[0] > time_max:
-                    #     time_max = row[0]
-                    if row[1] < load_min:
-                        load_min = row[1]
-                    if row[1] > load_max:
-                        load_max = row[1]
-                
-                h_scale = width / (time_max - time_min)
-                v_scale = height / (load_max - load_min)
-
-                # drawing area is y-inverted
-                top = height + 10
-
-                cr.move_to(10, top - (initial_point[1] - load_min) * v_scale)
-                for row in self.run_data[1:]:
-                    cr.line_to(10 + (row[0] - time_min) * h_scale, top - (row[1] - load_min) * v_scale)
-                cr.stroke()
-            else:
-                # no data, indicate as much
-                # connect each point to every other point
-                cr.move_to(self.coords[0][0], self.coords[0][1])
-                for coordinate in self.coords[1:]:
-                    cr.line_to(coordinate[0], coordinate[1]) 
-                cr.stroke()
-
-
-    def __poll_instrument(self):
-        '''
-        Poll the load frame via serial connection for data
-
-        Intended to be run as a thread
-        '''
-
-        with self.__polling_interval_changed_condition:
-            while True:
-                # poll the machine
-                now = monotonic()
-                load = self.machine.read_load() * self.range
-                extension = self.machine.read_extension()
-
-                # update UI
-                self.extension_field.set_text("{}".format(extension))
-                self.load_field.set_text("{}".format(load))
-
-                # if collecting data, add to data store
-                if self.__collecting_data:
-                    with self.__run_data_lock: # this may block, we need will need
-                                            # to refresh now before calculating delay
-                        self.run_data.append((now, load, extension))
-                        self.graph_canvas.queue_draw()
-                
-                # calculate time to next poll and wait
-                next_call = now + self.polling_interval
-                delay = next_call - monotonic()
-                if delay > self.minimal_delay:
-                    self.__polling_interval_changed_condition.wait(delay)
+        with self.__run_data_lock: # a snapshot won't change while drawing
+            run_data = self.run_data.snapshot(windowed=True)
+            window = self.run_data.window
+
+        if 1 < len(run_data): # plotting a single point gets weird
+            # mostly a blit of the cached curve, see graph.GraphRenderer
+            with registry.timer("graph.plot_data"):
+                self.graph.draw(cr, canvas.get_allocated_width(),
+                    canvas.get_allocated_height(), run_data, window)
+        else:
+            # no data, indicate as much
+            # connect each point to every other point
+            cr.set_source_rgb(0, 0, 0)
+            cr.set_line_width(0.5)
+            cr.move_to(self.coords[0][0], self.coords[0][1])
+            for coordinate in self.coords[1:]:
+                cr.line_to(coordinate[0], coordinate[1]) 
+            cr.stroke()
+
+
+    def __sample_acquired(self, now, load, extension):
+        '''
+        Callback invoked by the acquisition worker for each sample
+
+        Invoked on the acquisition thread so must not touch the UI
+        '''
+        self.latest_sample.publish((now, load, extension))
+
+        # if collecting data, add to data store
+        if self.__collecting_data:
+            with registry.locked(self.__run_data_lock, "application.run_data_lock_wait"):
+                self.run_data.append(now, load, extension)
+            recorder = self.recorder
+            if recorder:
+                recorder.record(now, load, extension)
+
+
+    def __refresh_display(self):
+        '''
+        Timer callback on the main loop; show the most recent sample and
+        redraw the graph if data has been collected since the last refresh
+        '''
+        if self.recorder and self.recorder.error:
+            self.__stop_recording()
+
+        sample = self.latest_sample.take()
+        if sample is None:
+            return True
+
+        now, load, extension = sample
+        self.extension_field.set_text("{}".format(extension))
+        self.load_field.set_text("{}".format(load))
+
+        if now >= self.__next_rate_display and self.acquisition:
+            self.__next_rate_display = now + self.rate_display_interval
+            rate_meter = self.acquisition.rate_meter
+            scheduler = self.acquisition.scheduler
+            self.acquisition_rate_label.set_text(
+                "{:.1f} samples/s of ~{:.1f} estimated for the link, jitter {:.2f} ms, {} overruns, {:.1f} bytes/sample".format(
+                    rate_meter.rate(), self.machine.maximum_sample_rate(),
+                    1000 * rate_meter.jitter(), scheduler.overruns if scheduler else 0,
+                    self.run_data.bytes_per_sample()))
+
+        length = len(self.run_data)
+        if length != self.__drawn_length:
+            self.__drawn_length = length
+            self.graph_canvas.queue_draw()
+        return True
 
 
 def main(version):
@@ -0,0 +1,273 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from abc import abstractmethod
+import asyncio
+from time import monotonic
+
+# Import from third party libraries
+from serial import Serial
+
+# Import from our module
+from .loadframe import AsyncLoadFrame, Sample
+from .tiniusolsen import (SettleDetector, TiniusOlsen1000Series, TiniusOlsenH5KSeries,
+                          TiniusOlsenLoadFrame)
+from .transport import AsyncSerialTransport
+
+'''
+asyncio drivers for Tinius Olsen load frames
+
+The command sets, reply decoding and load cell tables are those of the
+blocking drivers in the tiniusolsen module; only the I/O differs. Serial
+ports are read when the event loop reports them readable so many load frames
+can be driven from one thread e.g.
+
+    frame = await AsyncTiniusOlsenH5KSeries.connect("/dev/ttyUSB0")
+    async with frame:
+        sample = await frame.read_sample()
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class AsyncTiniusOlsenLoadFrame(AsyncLoadFrame):
+    '''
+    An abstract base class that implements some core functionality shared
+    by the asyncio drivers of all supported Tinius Olsen load frames
+
+    Concrete subclasses declare the same attributes and decoding methods as
+    their blocking counterparts.
+    '''
+
+    load_command = None
+    extension_command = None
+    range_lookup_table = {}
+
+    baud_rate = None
+    bits_per_byte = TiniusOlsenLoadFrame.bits_per_byte
+    sample_reply_length = None
+
+    maximum_sample_rate = TiniusOlsenLoadFrame.maximum_sample_rate
+
+
+    def __init__(self):
+        self.communication_port = None
+        self.transport = None
+        self.range = None
+
+
+    @classmethod
+    async def connect(cls, communication_port_name):
+        '''
+        Open a connection to a load frame
+
+        Parameters
+        --------
+        communication_port_name : str
+            the name of the serial port by which a compatible Tinius Olsen
+            load frame is connected
+
+        Raises
+        --------
+        IOError - if the serial port can not be opened
+        '''
+        frame = cls()
+        frame.communication_port = Serial(communication_port_name, cls.baud_rate, timeout=0,
+                                          exclusive=True)
+        frame.transport = AsyncSerialTransport(frame.communication_port)
+        try:
+            await frame._initialize()
+        except BaseException:
+            await frame.close()
+            raise
+        return frame
+
+
+    async def _initialize(self):
+        pass
+
+
+    async def close(self):
+        if self.communication_port:
+            try:
+                await self.stop_moving()
+            finally:
+                self.transport.close()
+                self.communication_port.close()
+                self.communication_port = None
+
+
+    async def _command(self, command):
+        '''
+        Send a command and get the reply
+
+        Returns
+        --------
+        bytes - the reply without its terminator
+        '''
+        return (await self.transport.command(command))[0]
+
+
+    @abstractmethod
+    def _decode_extension(self, reply):
+        '''
+        Convert a reply to extension_command to Millimeters (mm)
+        '''
+        pass
+
+
+    @abstractmethod
+    def _decode_load(self, reply):
+        '''
+        Convert a reply to load_command to Newtons (N)
+        '''
+        pass
+
+
+    async def get_load_cell_range(self):
+        load_cell_type = await self.read_load_cell_type()
+        try:
+            return self.range_lookup_table[load_cell_type]
+        except KeyError as ke:
+            raise LookupError("Machine reports unknown load cell is in use") from ke
+
+
+    async def read_load_cell_type(self):
+        '''
+        Get the type of the currently installed load cell; one of the keys
+        of range_lookup_table
+        '''
+        return (await self._command(b'RC')).decode('utf-8')
+
+
+    async def read_extension(self):
+        return self._decode_extension(await self._command(self.extension_command))
+
+
+    async def read_load(self):
+        return self._decode_load(await self._command(self.load_command))
+
+
+    async def read_sample(self):
+        '''
+        Get the current load and extension with a single timestamp; both
+        commands are sent in one write
+        '''
+        now = monotonic()
+        load, extension = await self.transport.command(self.load_command, self.extension_command)
+        return Sample(now, self._decode_load(load), self._decode_extension(extension))
+
+
+    async def set_run_rate(self, rate):
+        await self._command(b'WV' + bytes("{:.1f}".format(rate), 'utf-8')) # reply is an empty line
+
+
+    async def start_moving_up(self):
+        await self._command(b'WF') # reply is an empty line
+
+
+    async def start_moving_down(self):
+        await self._command(b'WR') # reply is an empty line
+
+
+    async def stop_moving(self):
+        await self._command(b'WS') # reply is an empty line
+
+
+class AsyncTiniusOlsenH5KSeries(AsyncTiniusOlsenLoadFrame):
+    '''
+    asyncio driver for Tinius Olsen H5K series load frame controllers; see
+    tiniusolsen.TiniusOlsenH5KSeries
+    '''
+
+    range_lookup_table = TiniusOlsenH5KSeries.range_lookup_table
+    load_command = TiniusOlsenH5KSeries.load_command
+    extension_command = TiniusOlsenH5KSeries.extension_command
+    baud_rate = TiniusOlsenH5KSeries.baud_rate
+    sample_reply_length = TiniusOlsenH5KSeries.sample_reply_length
+
+    _decode_extension = TiniusOlsenH5KSeries._decode_extension
+    _decode_load = TiniusOlsenH5KSeries._decode_load
+
+
+    async def _initialize(self):
+        self.range = await self.get_load_cell_range()
+
+
+    async def zero_extension(self):
+        await self._command(b'WP') # reply is an empty line
+
+
+    async def zero_load(self):
+        await self._command(b'WZ') # reply is an empty line
+
+
+class AsyncTiniusOlsen1000Series(AsyncTiniusOlsenLoadFrame):
+    '''
+    asyncio driver for Tinius Olsen 1000 series load frame controllers; see
+    tiniusolsen.TiniusOlsen1000Series
+
+    Zeroing is done in software once the controller has settled; readings
+    continue to use the previous zero until then.
+    '''
+
+    range_lookup_table = TiniusOlsen1000Series.range_lookup_table
+    load_command = TiniusOlsen1000Series.load_command
+    extension_command = TiniusOlsen1000Series.extension_command
+    baud_rate = TiniusOlsen1000Series.baud_rate
+    sample_reply_length = TiniusOlsen1000Series.sample_reply_length
+
+    settle_poll_interval = TiniusOlsen1000Series.settle_poll_interval
+    settle_window = TiniusOlsen1000Series.settle_window
+    settle_tolerance = TiniusOlsen1000Series.settle_tolerance
+    settle_timeout = TiniusOlsen1000Series.settle_timeout
+
+    _decode_extension = TiniusOlsen1000Series._decode_extension
+    _decode_load = TiniusOlsen1000Series._decode_load
+
+
+    def __init__(self):
+        super().__init__()
+        self.zero_load_offset = 0
+        self.zero_extension_offset = 0
+
+
+    async def _settle(self, zero_command, read_command):
+        await self._command(zero_command) # reply is an empty line
+        detector = SettleDetector(self.settle_window, self.settle_tolerance, self.settle_timeout)
+        offset = None
+        while offset is None:
+            await asyncio.sleep(self.settle_poll_interval)
+            offset = detector.add(monotonic(), await self._command(read_command))
+        return offset
+
+
+    async def zero_extension(self):
+        '''
+        Raises
+        --------
+        TimeoutError - if the extension doesn't settle
+        '''
+        self.zero_extension_offset = await self._settle(b'WE', self.extension_command)
+
+
+    async def zero_load(self):
+        '''
+        Raises
+        --------
+        TimeoutError - if the load doesn't settle
+        '''
+        self.zero_load_offset = await self._settle(b'WZ', self.load_command)
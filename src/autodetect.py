@@ -0,0 +1,170 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+# Import from third party libraries
+from serial import Serial, SerialException
+
+# Import from our module
+from .tiniusolsen import TiniusOlsen1000Series, TiniusOlsenH5KSeries
+from .transport import SerialTransport
+
+'''
+Find connected load frames without asking the user for the model
+
+Every candidate port is probed at the same time. On each port the load cell
+type is requested (RC) at the baud rate of each supported model in turn; the
+controllers' load cell codes don't overlap so a reply found in a model's
+range_lookup_table identifies the model. Probes wait only as long as the
+serial link needs plus a small allowance, retrying with a longer wait if a
+port doesn't answer, so detection takes a fraction of the drivers' 1 second
+timeout even when some ports are silent.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+Detection = namedtuple("Detection", ("port", "model", "machine"))
+Detection.__doc__ = '''
+A load frame found by detect(); machine is a connected instance of model
+'''
+
+candidate_models = (TiniusOlsenH5KSeries, TiniusOlsen1000Series)
+
+# seconds allowed for the controller to start replying, doubled on each
+# retry up to the maximum
+initial_allowance = 0.05
+maximum_allowance = 0.2
+
+# the longest reply to RC, including the terminator
+_reply_length = 4
+
+
+def probe_timeout(model, allowance):
+    '''
+    Get the time to wait for a reply to RC from a model of controller
+    '''
+    byte_time = model.bits_per_byte / model.baud_rate
+    return (len(b'RC\r') + _reply_length) * byte_time + allowance
+
+
+def probe(port_name, model, allowance=initial_allowance):
+    '''
+    Ask for the load cell type at a model's baud rate
+
+    Returns
+    --------
+    bool - True if the reply is a load cell type known to the model
+
+    Raises
+    --------
+    IOError - if the port can not be opened e.g. it is in use
+    '''
+    # exclusive, as the drivers open their ports, so a port in use by a
+    # connected load frame fails to open rather than being written to
+    with Serial(port_name, model.baud_rate, timeout=probe_timeout(model, allowance),
+                exclusive=True) as port:
+        port.reset_input_buffer()
+        transport = SerialTransport(port)
+        transport.send(b'RC')
+        reply = transport.receive()
+    return reply.decode('ascii', 'replace') in model.range_lookup_table
+
+
+def _identify(port_name, models):
+    # try each model on one port, waiting longer each round for a slow
+    # controller; returns a Detection or None
+    allowance = initial_allowance
+    while allowance <= maximum_allowance:
+        for model in models:
+            machine = None
+            try:
+                if not probe(port_name, model, allowance):
+                    continue
+                machine = model(port_name)
+                # confirm with the driver itself; a garbled reply could
+                # match. The H5K driver reads the range as it connects.
+                if getattr(machine, "range", None) is None:
+                    machine.get_load_cell_range()
+                return Detection(port_name, model, machine)
+            except (IOError, SerialException, LookupError, ValueError):
+                # in use, not a serial port or not a load frame
+                if machine is not None:
+                    # release the port now rather than when collected
+                    try:
+                        machine.close()
+                    except (IOError, SerialException):
+                        pass
+                return None
+        allowance *= 2
+    return None
+
+
+def detect(port_names, models=candidate_models, preferred=None):
+    '''
+    Probe ports in parallel for supported load frames
+
+    Parameters
+    --------
+    port_names : list
+        the devices to probe e.g. ["/dev/ttyUSB0", "/dev/ttyUSB1"]
+    models : list
+        the load frame classes to try
+    preferred : dict
+        optionally maps port names to the model to try first on that port
+        e.g. the model last connected through it
+
+    Returns
+    --------
+    list - of Detection, one for each port a load frame was found on
+    '''
+    port_names = list(port_names)
+    if not port_names:
+        return []
+    preferred = preferred or {}
+
+    def identify(port_name):
+        first = preferred.get(port_name)
+        return _identify(port_name, sorted(models, key=lambda model: model is not first))
+
+    with ThreadPoolExecutor(len(port_names)) as executor:
+        return [detection for detection in executor.map(identify, port_names) if detection]
+
+
+def main(argv=None):
+    '''
+    Print the load frames found on the given ports or every serial port
+    '''
+    from serial.tools.list_ports import comports
+    from time import perf_counter
+
+    port_names = argv if argv else [port.device for port in comports()]
+    start = perf_counter()
+    detections = detect(port_names)
+    elapsed = perf_counter() - start
+    for detection in detections:
+        print("{} on {} with a {} N load cell".format(detection.model.__name__,
+            detection.port, detection.machine.get_load_cell_range()))
+        detection.machine.close()
+    print("Probed {} ports in {:.3f} s".format(len(port_names), elapsed))
+    return 0 if detections else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,447 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import argparse
+from contextlib import ExitStack
+import json
+import platform
+from random import random
+import resource
+import subprocess
+import sys
+from threading import Lock
+from time import perf_counter, process_time, sleep, time
+import tracemalloc
+
+# Import from our module
+from .acquisition import Acquisition, DeadlineScheduler
+from .rundata import MappedRunData, RunData
+from .session import Session
+from .tiniusolsen import TiniusOlsen1000Series, TiniusOlsenH5KSeries
+
+'''
+Benchmarks for the data acquisition hot path
+
+Runs the drivers and the headless acquisition loop used by the GUI against an
+emulated load frame (see emulator.py), started in a separate process so its
+CPU use is not counted, or against a real load frame. Results are written as
+JSON so runs on different commits can be compared e.g.
+
+    python3 -m load_frame_controller.benchmark --output before.json
+    python3 -m load_frame_controller.benchmark --compare before.json
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+models = {
+    "h5k": TiniusOlsenH5KSeries,
+    "1000": TiniusOlsen1000Series
+}
+
+# metrics compared by --compare and whether a larger value is better
+compared_metrics = {
+    ("sustained", "samples_per_second"): True,
+    ("sustained", "cpu_seconds_per_sample"): False,
+    ("jitter", "interval_stdev"): False,
+    ("latency", "read_sample", "p99"): False,
+    ("memory", "bytes_per_sample"): False,
+    ("scaling", "slowest_frame_ratio"): True,
+    ("stop_latency", "p99"): False
+}
+
+
+def summarize(values):
+    '''
+    Get the count, mean, min, max and 50th, 90th and 99th percentiles of a
+    list of numbers
+    '''
+    ordered = sorted(values)
+    count = len(ordered)
+    if 0 == count:
+        return {"count": 0}
+
+    def percentile(p):
+        return ordered[min(count - 1, int(round(p / 100 * (count - 1))))]
+
+    return {
+        "count": count,
+        "mean": sum(ordered) / count,
+        "min": ordered[0],
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": ordered[-1]
+    }
+
+
+class EmulatorProcess:
+    '''
+    Run emulator.py in a child process for the duration of a with block
+    '''
+
+    def __init__(self, model, *arguments):
+        self.command = [sys.executable, "-m", __package__ + ".emulator",
+                        "--model", model] + list(arguments)
+        self.process = None
+        self.port_name = None
+
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+        line = self.process.stdout.readline()
+        self.port_name = line.strip().rsplit(" ", 1)[-1]
+        return self
+
+
+    def __exit__(self, *_args):
+        self.process.terminate()
+        self.process.wait()
+
+
+class HeadlessRun:
+    '''
+    The data handling the GUI does for each sample, without the GUI
+    '''
+
+    def __init__(self, run_data=None):
+        self.run_data = run_data if run_data is not None else RunData()
+        self.run_data_lock = Lock()
+
+
+    def on_sample(self, now, load, extension):
+        with self.run_data_lock:
+            self.run_data.append(now, load, extension)
+
+
+def benchmark_latency(machine, repetitions):
+    '''
+    Time round trips of individual driver calls
+    '''
+    calls = {
+        "read_load": machine.read_load,
+        "read_extension": machine.read_extension,
+        "read_sample": machine.read_sample,
+        "read_load_cell_type": machine.read_load_cell_type,
+        "stop_moving": machine.stop_moving
+    }
+    results = {}
+    for name, call in calls.items():
+        latencies = []
+        for _ in range(repetitions):
+            start = perf_counter()
+            call()
+            latencies.append(perf_counter() - start)
+        results[name] = summarize(latencies)
+    return results
+
+
+def run_acquisition(machine, duration, polling_interval=None, run_data=None, configure=None):
+    '''
+    Run the acquisition loop for a time and collect the sample times
+
+    Parameters
+    --------
+    configure : callable
+        optionally called with the Acquisition before it is started
+
+    Returns
+    --------
+    tuple - the HeadlessRun holding the data and the CPU seconds used
+    '''
+    run = HeadlessRun(run_data)
+    acquisition = Acquisition(machine, run.on_sample, machine.get_load_cell_range(),
+                              polling_interval or 1)
+    acquisition.set_free_run(polling_interval is None)
+    if configure:
+        configure(acquisition)
+    cpu_start = process_time()
+    acquisition.start()
+    sleep(duration)
+    acquisition.stop()
+    run.acquisition = acquisition
+    return run, process_time() - cpu_start
+
+
+def benchmark_sustained(machine, duration):
+    '''
+    Measure the rate and CPU cost of acquisition in free run mode
+    '''
+    run, cpu = run_acquisition(machine, duration)
+    run_data = run.run_data.snapshot()
+    samples = len(run_data)
+    elapsed = run_data[-1][0] - run_data[0][0] if 1 < samples else 0
+    return {
+        "samples": samples,
+        "samples_per_second": (samples - 1) / elapsed if elapsed else 0.0,
+        # from the replies seen in this run, see maximum_sample_rate
+        "estimated_link_limit_samples_per_second": machine.maximum_sample_rate(),
+        "cpu_seconds_per_sample": cpu / samples if samples else None
+    }
+
+
+def benchmark_jitter(machine, duration, rate, overrun_policy=DeadlineScheduler.SKIP,
+                     realtime=False):
+    '''
+    Measure how regular the interval between samples is at a fixed rate and
+    how far the samples drift from the requested grid
+    '''
+    def configure(acquisition):
+        acquisition.set_overrun_policy(overrun_policy)
+        acquisition.realtime = realtime
+
+    run, _cpu = run_acquisition(machine, duration, 1 / rate, configure=configure)
+    times = list(run.run_data.snapshot().column("time"))
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    summary = summarize(intervals)
+    count = len(intervals)
+    mean = summary.get("mean", 0)
+    summary["requested_interval"] = 1 / rate
+    summary["interval_stdev"] = (sum((i - mean) ** 2 for i in intervals) / count) ** 0.5 if count else None
+    # how far the last sample is from where an exact grid would put it
+    summary["drift"] = times[-1] - times[0] - count / rate if count else None
+    summary["schedule"] = run.acquisition.schedule_statistics()
+    return summary
+
+
+def benchmark_stop_latency(machine, repetitions):
+    '''
+    Time stop commands sent while acquisition polls as fast as it can, the
+    worst case for a stop queued behind reads
+    '''
+    run = HeadlessRun()
+    acquisition = Acquisition(machine, run.on_sample, machine.get_load_cell_range(), 1)
+    acquisition.set_free_run(True)
+    acquisition.start()
+    latencies = []
+    try:
+        for _ in range(repetitions):
+            # land at arbitrary points in the poll cycle
+            sleep(0.005 + 0.01 * random())
+            start = perf_counter()
+            machine.stop_moving()
+            latencies.append(perf_counter() - start)
+    finally:
+        acquisition.stop()
+    return summarize(latencies)
+
+
+def benchmark_memory(machine, duration, mapped=False):
+    '''
+    Measure how memory grows over a long free running acquisition
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    run, _cpu = run_acquisition(machine, duration,
+                                run_data=MappedRunData() if mapped else None)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    samples = len(run.run_data)
+    return {
+        "samples": samples,
+        "traced_growth_bytes": after - before,
+        "bytes_per_sample": (after - before) / samples if samples else None,
+        "store_bytes_per_sample": run.run_data.bytes_per_sample(),
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def benchmark_model(model, port_name, args):
+    '''
+    Run all benchmarks against one load frame
+    '''
+    machine = models[model](port_name)
+    try:
+        link_limit = machine.maximum_sample_rate()
+        machine.transport.reset_statistics()
+        results = {
+            "latency": benchmark_latency(machine, args.repetitions),
+            "stop_latency": benchmark_stop_latency(machine, args.repetitions),
+            "sustained": benchmark_sustained(machine, args.duration),
+            "jitter": benchmark_jitter(machine, args.duration, args.jitter_fraction * link_limit,
+                                       args.overrun, args.realtime),
+            "memory": benchmark_memory(machine, args.memory_duration, args.mapped)
+        }
+        results["transport"] = machine.transport.statistics()
+        results["link"] = machine.link_statistics()
+        return results
+    finally:
+        # close while the load frame, or emulator, is still there to reply
+        machine.close()
+
+
+def session_rates(session, duration):
+    # free run every frame of a session and get each frame's sample rate
+    session.clear()
+    session.start(direction=0)
+    sleep(duration)
+    session.stop()
+    rates = {}
+    for name, frame in session.frames.items():
+        run_data = frame.snapshot()
+        elapsed = run_data[-1][0] - run_data[0][0] if 1 < len(run_data) else 0
+        rates[name] = (len(run_data) - 1) / elapsed if elapsed else 0.0
+    return rates
+
+
+def benchmark_scaling(model, frames, duration, emulator_args):
+    '''
+    Measure whether acquiring from several frames at once, in one session,
+    slows any of them compared to acquiring from one alone
+    '''
+    with ExitStack() as stack:
+        emulators = [stack.enter_context(EmulatorProcess(model, *emulator_args))
+                     for _index in range(frames)]
+        machines = [models[model](emulator.port_name) for emulator in emulators]
+        for machine in machines:
+            # close ports while the emulators are still running
+            stack.callback(machine.close)
+        session = Session(free_run=True)
+        stack.callback(session.close)
+
+        # one frame alone, then all of them together
+        session.add_frame(emulators[0].port_name, machines[0])
+        single_rate = session_rates(session, duration)[emulators[0].port_name]
+        for emulator, machine in zip(emulators[1:], machines[1:]):
+            session.add_frame(emulator.port_name, machine)
+        cpu_start = process_time()
+        rates = session_rates(session, duration)
+        cpu = process_time() - cpu_start
+
+        start_spread = session.start(direction=1)
+        stop_spread = session.stop()
+
+        return {
+            "frames": frames,
+            "single_frame_samples_per_second": single_rate,
+            "samples_per_second": summarize(list(rates.values())),
+            "slowest_frame_ratio": min(rates.values()) / single_rate if single_rate else None,
+            "cpu_seconds_per_sample": cpu / max(1, sum(rates.values()) * duration),
+            "start_spread": start_spread,
+            "stop_spread": stop_spread
+        }
+
+
+def lookup(results, path):
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(baseline, current, tolerance):
+    '''
+    Print the change in key metrics between two result sets
+
+    Returns
+    --------
+    bool - True if any metric got worse by more than tolerance
+    '''
+    regressed = False
+    for model, results in current["results"].items():
+        for path, larger_is_better in compared_metrics.items():
+            old = lookup(baseline.get("results", {}).get(model), path)
+            new = lookup(results, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if larger_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressed = True
+            print("{:5} {:40} {:>12.6g} -> {:<12.6g} {:+.1%}{}".format(
+                model, ".".join(path), old, new, change, flag))
+    return regressed
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    '''
+    Run the benchmarks and write the results
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark load frame data acquisition")
+    parser.add_argument("--model", choices=sorted(models), action="append",
+                        help="model to benchmark, may be repeated; default all")
+    parser.add_argument("--port", help="benchmark a real load frame on this port instead of an emulator;"
+                        " --model must then be given once")
+    parser.add_argument("--repetitions", type=int, default=200, help="round trips per command")
+    parser.add_argument("--duration", type=float, default=10, help="seconds for rate and jitter runs")
+    parser.add_argument("--memory-duration", type=float, default=30, help="seconds for the memory run")
+    parser.add_argument("--mapped", action="store_true",
+                        help="keep the memory run's data in a memory mapped file")
+    parser.add_argument("--jitter-fraction", type=float, default=0.5,
+                        help="fixed rate for the jitter run as a fraction of the estimated link limit")
+    parser.add_argument("--overrun", choices=(DeadlineScheduler.SKIP, DeadlineScheduler.CATCH_UP),
+                        default=DeadlineScheduler.SKIP, help="what the jitter run does when a poll overruns")
+    parser.add_argument("--realtime", action="store_true",
+                        help="poll from a SCHED_FIFO thread in the jitter run; needs privileges")
+    parser.add_argument("--frames", type=int, default=0,
+                        help="also measure acquiring from this many emulated frames at once")
+    parser.add_argument("--emulator-args", default="", help="extra arguments for the emulator e.g. '--latency 0.002'")
+    parser.add_argument("--output", default="benchmark.json", help="file to write results to")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fractional change treated as a regression by --compare")
+    args = parser.parse_args(argv)
+    if args.port and (not args.model or 1 < len(args.model)):
+        parser.error("--port needs the --model of the load frame on it")
+
+    results = {}
+    for model in args.model or sorted(models):
+        print("Benchmarking {}".format(model))
+        sys.stdout.flush()
+        if args.port:
+            results[model] = benchmark_model(model, args.port, args)
+        else:
+            with EmulatorProcess(model, *args.emulator_args.split()) as emulator:
+                results[model] = benchmark_model(model, emulator.port_name, args)
+            if 1 < args.frames:
+                results[model]["scaling"] = benchmark_scaling(model, args.frames,
+                    args.duration, args.emulator_args.split())
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "configuration": vars(args),
+        "results": results
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print("Wrote results to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(baseline, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from collections import deque
+
+'''
+Reduce run data to a number of points suited to the width of a graph
+
+There is no point drawing hundreds of thousands of line segments into a few
+hundred pixel wide graph. Samples are grouped into buckets of equal duration
+and only the minimum and maximum load of each bucket are drawn which keeps
+peaks, such as the load at which a specimen breaks, visible.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class MinMaxDecimator:
+    '''
+    Incrementally reduce the load over time series in a RunData instance to
+    the minimum and maximum load in each of a bounded number of time buckets
+
+    Only samples appended since the previous update are examined. When there
+    are more than twice as many buckets as requested, adjacent buckets are
+    merged and the bucket duration doubles, so the work per update and the
+    number of points produced depend on the number of buckets rather than the
+    length of the run.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        '''
+        Forget all samples
+        '''
+        self._buckets = deque()  # lists of [index, min_t, min_v, max_t, max_v]
+        self._bucket_duration = None
+        self._origin = None
+        self._columns = 0
+        self._generation = None
+        self._consumed = 0
+        self._points = []
+        self._last = None
+
+
+    def update(self, run_data, columns):
+        '''
+        Reduce a snapshot of run data
+
+        Parameters
+        --------
+        run_data : rundata.RunDataView
+            a snapshot of the run data; successive snapshots of the same
+            store are processed incrementally
+        columns : int
+            the number of buckets wanted, usually the width of the graph in
+            pixels
+
+        Returns
+        --------
+        list - of (time, load) tuples in time order, at most four per column
+        '''
+        columns = max(1, int(columns))
+        if (run_data.generation != self._generation or columns > self._columns
+                or run_data.stop < self._consumed):
+            self.reset()
+            self._generation = run_data.generation
+            self._consumed = run_data.start
+        self._columns = columns
+
+        if run_data.stop == self._consumed and self._points:
+            return self._points
+
+        for times, loads, _extensions in run_data.chunks(self._consumed - run_data.start):
+            for time, load in zip(times, loads):
+                self._add(time, load)
+        self._consumed = run_data.stop
+
+        # forget buckets which have scrolled out of a windowed snapshot
+        if 0 < len(run_data):
+            oldest = run_data[0][0]
+            buckets = self._buckets
+            while buckets and buckets[0][3] < oldest and buckets[0][1] < oldest:
+                buckets.popleft()
+
+        while len(self._buckets) > 2 * columns:
+            self._merge()
+
+        self._points = self._build_points()
+        return self._points
+
+
+    def _add(self, time, load):
+        self._last = (time, load)
+        if self._origin is None:
+            self._origin = time
+            self._buckets.append([0, time, load, time, load])
+            return
+        if self._bucket_duration is None:
+            # start with one sample per bucket and let merging widen them
+            self._bucket_duration = max(time - self._origin, 1e-6)
+
+        index = int((time - self._origin) / self._bucket_duration)
+        bucket = self._buckets[-1] if self._buckets else None
+        if bucket is None or index != bucket[0]:
+            self._buckets.append([index, time, load, time, load])
+            if len(self._buckets) > 4 * self._columns:
+                self._merge()
+            return
+        if load < bucket[2]:
+            bucket[1] = time
+            bucket[2] = load
+        if load > bucket[4]:
+            bucket[3] = time
+            bucket[4] = load
+
+
+    def _merge(self):
+        # double the bucket duration combining pairs of adjacent buckets
+        self._bucket_duration *= 2
+        merged = deque()
+        for bucket in self._buckets:
+            index = bucket[0] // 2
+            if merged and merged[-1][0] == index:
+                target = merged[-1]
+                if bucket[2] < target[2]:
+                    target[1] = bucket[1]
+                    target[2] = bucket[2]
+                if bucket[4] > target[4]:
+                    target[3] = bucket[3]
+                    target[4] = bucket[4]
+            else:
+                bucket[0] = index
+                merged.append(bucket)
+        self._buckets = merged
+
+
+    def _build_points(self):
+        points = []
+        for _index, min_t, min_v, max_t, max_v in self._buckets:
+            if min_t < max_t:
+                points.append((min_t, min_v))
+                points.append((max_t, max_v))
+            elif max_t < min_t:
+                points.append((max_t, max_v))
+                points.append((min_t, min_v))
+            else:
+                points.append((min_t, min_v))
+        # always end the line at the most recent sample
+        if self._last is not None and (not points or points[-1] != self._last):
+            points.append(self._last)
+        return points
@@ -0,0 +1,487 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import argparse
+import math
+import os
+from random import Random
+import select
+import sys
+from threading import Event, Thread
+from time import monotonic, sleep
+import tty
+
+# Import from our module
+from .tiniusolsen import TiniusOlsen1000Series, TiniusOlsenH5KSeries
+from .transport import FrameParser
+
+'''
+An emulator for Tinius Olsen load frame controllers
+
+The emulator opens a Linux pseudo-terminal and answers the commands described
+in docs/ on it so the drivers in tiniusolsen.py, and everything built on them,
+can be exercised without tying up a real load frame e.g.
+
+    python3 -m load_frame_controller.emulator --model h5k
+
+prints the name of a device such as /dev/pts/5 which can be passed to
+TiniusOlsenH5KSeries. The emulator can throttle replies to the baud rate of
+the real controller, delay replies, add noise to readings, drop bytes and
+simulate a specimen being pulled to failure.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class Specimen:
+    '''
+    A simple model of the load produced by a specimen as the crosshead moves:
+    linear elastic up to the yield point, strain hardening up to the ultimate
+    load, necking down to the breaking load and then no load at all.
+
+    Compression is treated as linear elastic.
+    '''
+
+    def __init__(self, stiffness, yield_load, ultimate_load,
+                 ultimate_extension, break_extension):
+        '''
+        Parameters
+        --------
+        stiffness : float
+            the slope of the elastic region in Newtons per millimeter
+        yield_load : float
+            the load at the end of the elastic region in Newtons
+        ultimate_load : float
+            the maximum load the specimen can carry in Newtons
+        ultimate_extension : float
+            the extension in mm at which the ultimate load is reached
+        break_extension : float
+            the extension in mm at which the specimen breaks
+        '''
+        self.stiffness = stiffness
+        self.yield_load = yield_load
+        self.ultimate_load = ultimate_load
+        self.yield_extension = yield_load / stiffness
+        self.ultimate_extension = max(ultimate_extension, self.yield_extension)
+        self.break_extension = max(break_extension, self.ultimate_extension)
+        self.broken = False
+
+
+    @classmethod
+    def for_load_cell(cls, load_cell_range):
+        '''
+        Create a specimen which fails at 80% of the rated load of a load cell
+        after a few millimeters of extension
+        '''
+        return cls(stiffness=0.6 * load_cell_range,
+                   yield_load=0.6 * load_cell_range,
+                   ultimate_load=0.8 * load_cell_range,
+                   ultimate_extension=3.0,
+                   break_extension=4.0)
+
+
+    def load(self, extension):
+        '''
+        Get the load in Newtons for an extension in millimeters
+        '''
+        if self.broken or extension >= self.break_extension:
+            self.broken = True
+            return 0.0
+        if extension <= self.yield_extension:
+            return self.stiffness * extension
+        if extension <= self.ultimate_extension:
+            # quadratic hardening with zero slope at the ultimate load
+            span = self.ultimate_extension - self.yield_extension
+            remaining = (self.ultimate_extension - extension) / span
+            return self.ultimate_load - (self.ultimate_load - self.yield_load) * remaining * remaining
+        # linear necking down to 90% of the ultimate load
+        span = self.break_extension - self.ultimate_extension
+        return self.ultimate_load * (1 - 0.1 * (extension - self.ultimate_extension) / span)
+
+
+class EmulatedController:
+    '''
+    An abstract base class for the command set of an emulated controller.
+
+    Subclasses convert between the physical state of the emulated load frame
+    and the replies of a particular controller.
+    '''
+
+    baud_rate = None
+    range_lookup_table = {}
+    default_load_cell_type = None
+    zero_extension_command = None
+
+
+    def __init__(self, load_cell_type=None):
+        self.load_cell_type = load_cell_type or self.default_load_cell_type
+        self.load_cell_range = self.range_lookup_table[self.load_cell_type]
+        self.load_offset = 0.0
+        self.extension_offset = 0.0
+
+
+    def encode_load(self, load):
+        raise NotImplementedError()
+
+
+    def encode_extension(self, extension):
+        raise NotImplementedError()
+
+
+    def zero_load(self, load):
+        pass
+
+
+    def zero_extension(self, extension):
+        pass
+
+
+class EmulatedH5KController(EmulatedController):
+    '''
+    The command set of a Tinius Olsen H5K series controller. Zeroing is done
+    in the controller and affects readings.
+    '''
+
+    baud_rate = 19200
+    range_lookup_table = TiniusOlsenH5KSeries.range_lookup_table
+    default_load_cell_type = "53"
+    load_command = b'RL'
+    extension_command = b'RP'
+    zero_extension_command = b'WP'
+
+
+    def encode_load(self, load):
+        return int(round((load - self.load_offset) / self.load_cell_range * 30000))
+
+
+    def encode_extension(self, extension):
+        return int(round((extension - self.extension_offset) * 1000))
+
+
+    def zero_load(self, load):
+        self.load_offset = load
+
+
+    def zero_extension(self, extension):
+        self.extension_offset = extension
+
+
+class Emulated1000SeriesController(EmulatedController):
+    '''
+    The command set of a Tinius Olsen 1000 series controller. Zeroing only
+    affects the controller's display; readings are always absolute.
+    '''
+
+    baud_rate = 9600
+    range_lookup_table = TiniusOlsen1000Series.range_lookup_table
+    default_load_cell_type = "0"
+    load_command = b'R1'
+    extension_command = b'R2'
+    zero_extension_command = b'WE'
+
+
+    def encode_load(self, load):
+        counts = 2048 + int(round(load / self.load_cell_range * 2000))
+        return min(4048, max(48, counts))
+
+
+    def encode_extension(self, extension):
+        return int(round(extension * 1000))
+
+
+class LoadFrameEmulator:
+    '''
+    Emulate a load frame controller on a pseudo-terminal
+
+    Use as a context manager or call start() and stop(). While running,
+    port_name holds the name of the device to open e.g. /dev/pts/5
+    '''
+
+    controllers = {
+        "h5k": EmulatedH5KController,
+        "1000": Emulated1000SeriesController
+    }
+
+    bits_per_byte = 10  # 8N1 framing
+
+
+    def __init__(self, model="h5k", load_cell_type=None, throttle=True,
+                 baud_rate=None, latency=0.0, noise=0.0, drop_rate=0.0,
+                 specimen=None, seed=None, settle_time=0.0):
+        '''
+        Parameters
+        --------
+        model : str
+            the controller to emulate; one of the keys of controllers
+        load_cell_type : str
+            the reply to the RC command, defaults to a common load cell
+        throttle : bool
+            if True replies are delayed by the time the real serial link
+            would need to transmit the command and reply
+        baud_rate : int
+            the baud rate to throttle to, defaults to that of the controller
+        latency : float
+            additional seconds the controller takes to answer each command
+        noise : float
+            standard deviation of noise added to load readings as a fraction
+            of the load cell range
+        drop_rate : float
+            probability that any byte of a reply is lost
+        specimen : Specimen
+            the specimen in the load frame, defaults to one sized for the
+            load cell
+        seed : int
+            seed for the random number generator used for noise and dropped
+            bytes so runs can be repeated
+        settle_time : float
+            seconds for which readings ring, as the controller settles,
+            after a zero command
+        '''
+        self.controller = self.controllers[model](load_cell_type)
+        self.throttle = throttle
+        self.baud_rate = baud_rate or self.controller.baud_rate
+        self.latency = latency
+        self.noise = noise
+        self.drop_rate = drop_rate
+        self.settle_time = settle_time
+        self._zeroed_at = None
+        self.specimen = specimen or Specimen.for_load_cell(self.controller.load_cell_range)
+        self._random = Random(seed)
+
+        # the physical state of the load frame
+        self.run_rate = 1.0  # mm/min
+        self.direction = 0  # 1 up, -1 down, 0 stopped
+        self._position = 0.0
+        self._position_time = monotonic()
+
+        self.port_name = None
+        self.commands_received = 0
+        self.bytes_dropped = 0
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop = Event()
+        self._parser = FrameParser()
+        self._line_free_at = 0.0
+
+        self._handlers = {
+            b'RC': self._read_load_cell_type,
+            self.controller.load_command: self._read_load,
+            self.controller.extension_command: self._read_extension,
+            b'WV': self._set_run_rate,
+            b'WF': self._start_moving_up,
+            b'WR': self._start_moving_down,
+            b'WS': self._stop_moving,
+            b'WZ': self._zero_load,
+            self.controller.zero_extension_command: self._zero_extension
+        }
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *_args):
+        self.stop()
+
+
+    def start(self):
+        '''
+        Open the pseudo-terminal and start answering commands in a thread
+        '''
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port_name = os.ttyname(self._slave)
+        self._stop.clear()
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        '''
+        Stop answering commands and close the pseudo-terminal
+        '''
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+
+    @property
+    def position(self):
+        '''
+        The current crosshead position in millimeters
+        '''
+        return self._advance()
+
+
+    def _advance(self):
+        # move the crosshead at the current rate and direction up to now
+        now = monotonic()
+        self._position += self.direction * self.run_rate / 60 * (now - self._position_time)
+        self._position_time = now
+        return self._position
+
+
+    def load(self):
+        '''
+        The current load on the specimen in Newtons without noise
+        '''
+        return self.specimen.load(self.position)
+
+
+    def _serve(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                # no process has the terminal open
+                sleep(0.01)
+                continue
+            self._parser.feed(data)
+            command = self._parser.pop()
+            while command is not None:
+                self._answer(command)
+                command = self._parser.pop()
+
+
+    def _answer(self, command):
+        self.commands_received += 1
+        handler = self._handlers.get(bytes(command[:2]))
+        reply = handler(bytes(command[2:])) if handler else None
+        reply = b'' if reply is None else str(reply).encode('ascii')
+        reply += b'\r'
+
+        if self.drop_rate:
+            kept = bytes(b for b in reply if self._random.random() >= self.drop_rate)
+            self.bytes_dropped += len(reply) - len(kept)
+            reply = kept
+
+        # model the time the real controller and serial link would need
+        if self.throttle or self.latency:
+            now = monotonic()
+            byte_time = self.bits_per_byte / self.baud_rate if self.throttle else 0
+            start = max(now, self._line_free_at) + (len(command) + 1) * byte_time + self.latency
+            self._line_free_at = start + len(reply) * byte_time
+            if self._line_free_at > now:
+                sleep(self._line_free_at - now)
+
+        os.write(self._master, reply)
+
+
+    def _read_load_cell_type(self, _argument):
+        return self.controller.load_cell_type
+
+
+    def _ringing(self):
+        # a decaying oscillation, as a fraction, while settling after a zero
+        if self._zeroed_at is None:
+            return 0.0
+        elapsed = monotonic() - self._zeroed_at
+        if elapsed >= self.settle_time:
+            return 0.0
+        return math.exp(-5 * elapsed / self.settle_time) * math.cos(6 * math.pi * elapsed)
+
+
+    def _read_load(self, _argument):
+        load = self.load()
+        if self.noise:
+            load += self._random.gauss(0, self.noise * self.controller.load_cell_range)
+        load += 0.01 * self.controller.load_cell_range * self._ringing()
+        return self.controller.encode_load(load)
+
+
+    def _read_extension(self, _argument):
+        return self.controller.encode_extension(self.position + 0.05 * self._ringing())
+
+
+    def _set_run_rate(self, argument):
+        try:
+            self._advance()
+            self.run_rate = min(1500.0, max(1.0, float(argument)))
+        except ValueError:
+            pass
+
+
+    def _start_moving_up(self, _argument):
+        self._advance()
+        self.direction = 1
+
+
+    def _start_moving_down(self, _argument):
+        self._advance()
+        self.direction = -1
+
+
+    def _stop_moving(self, _argument):
+        self._advance()
+        self.direction = 0
+
+
+    def _zero_load(self, _argument):
+        self.controller.zero_load(self.load())
+        if self.settle_time:
+            self._zeroed_at = monotonic()
+
+
+    def _zero_extension(self, _argument):
+        self.controller.zero_extension(self.position)
+        if self.settle_time:
+            self._zeroed_at = monotonic()
+
+
+def main(argv=None):
+    '''
+    Run an emulator until interrupted
+    '''
+    parser = argparse.ArgumentParser(description="Emulate a Tinius Olsen load frame controller on a pseudo-terminal")
+    parser.add_argument("--model", choices=sorted(LoadFrameEmulator.controllers), default="h5k")
+    parser.add_argument("--load-cell-type", help="reply to the RC command")
+    parser.add_argument("--no-throttle", action="store_true", help="reply as fast as possible")
+    parser.add_argument("--baud-rate", type=int, help="baud rate to throttle replies to")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra reply delay in seconds")
+    parser.add_argument("--noise", type=float, default=0.0, help="load noise as a fraction of range")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of dropping a reply byte")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--settle-time", type=float, default=0.0,
+                        help="seconds readings ring for after zeroing")
+    args = parser.parse_args(argv)
+
+    emulator = LoadFrameEmulator(args.model, load_cell_type=args.load_cell_type,
+        throttle=not args.no_throttle, baud_rate=args.baud_rate,
+        latency=args.latency, noise=args.noise, drop_rate=args.drop_rate,
+        seed=args.seed, settle_time=args.settle_time)
+    with emulator:
+        print("Emulating {} controller on {}".format(args.model, emulator.port_name))
+        sys.stdout.flush()
+        try:
+            while True:
+                sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
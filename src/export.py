@@ -0,0 +1,331 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import gzip
+from importlib.util import find_spec
+import json
+import os
+from threading import Event, Thread
+
+# Import from our module
+from .instrumentation import registry
+
+'''
+Export run data to files without blocking acquisition or the UI
+
+An export works from a snapshot of the run data, which is cheap to take and
+doesn't change while more samples are collected, and writes it from a
+worker thread in large blocks.
+
+Besides CSV, runs can be exported to binary formats which are much smaller
+and faster to write and load. Each format writes straight from the columns of
+the run data and keeps the metadata about the run e.g. the load cell range
+next to the data; in a JSON file alongside the CSV formats and inside the
+file for the others. NumPy, pyarrow and h5py are optional; formats needing a
+library which is not installed are not offered.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class ExportCancelled(Exception):
+    '''
+    Raised inside an export when it has been cancelled
+    '''
+    pass
+
+
+class ExportFormat:
+    '''
+    Base class of the file formats run data can be exported to
+    '''
+
+    # shown in the save dialog's filter list
+    name = None
+    extension = None
+
+    # the module required to write this format, if not the standard library
+    requires = None
+
+    column_titles = ("Time", "Load (N)", "Extension (mm)")
+
+
+    @classmethod
+    def available(cls):
+        return cls.requires is None or find_spec(cls.requires) is not None
+
+
+    def write(self, job):
+        '''
+        Write job.run_data and job.metadata to job.filename calling
+        job.advance() after each block of samples
+        '''
+        raise NotImplementedError()
+
+
+    def files_written(self, filename):
+        '''
+        Get every file an export to filename writes, so a failed or
+        cancelled export can be cleaned up
+        '''
+        return [filename]
+
+
+class CSVFormat(ExportFormat):
+    name = "CSV files"
+    extension = ".csv"
+
+    # the same text csv.writer produces but without a tuple per row
+    _line = "{!r},{!r},{!r}\r\n".format
+
+
+    def _open(self, filename):
+        return open(filename, 'w', newline='', buffering=ExportJob.buffer_size)
+
+
+    def write(self, job):
+        with self._open(job.filename) as output:
+            output.write(",".join(self.column_titles) + "\r\n")
+            for times, loads, extensions in job.run_data.chunks():
+                output.write("".join(map(self._line, times, loads, extensions)))
+                job.advance(len(times))
+        with open(job.filename + ".json", 'w') as sidecar:
+            json.dump(job.metadata, sidecar, indent=2)
+
+
+    def files_written(self, filename):
+        # the metadata goes in a sidecar
+        return [filename, filename + ".json"]
+
+
+class CompressedCSVFormat(CSVFormat):
+    name = "Compressed CSV files"
+    extension = ".csv.gz"
+
+
+    def _open(self, filename):
+        # a low compression level is much faster and nearly as small
+        return gzip.open(filename, 'wt', compresslevel=3, newline='')
+
+
+class NumPyFormat(ExportFormat):
+    '''
+    A NumPy .npz archive of one array per column plus a metadata array
+    holding a JSON string
+    '''
+    name = "NumPy archives"
+    extension = ".npz"
+    requires = "numpy"
+
+
+    def write(self, job):
+        import numpy
+
+        columns = [numpy.empty(len(job.run_data)) for _name in job.run_data.column_names]
+        index = 0
+        for chunk in job.run_data.chunks():
+            count = len(chunk[0])
+            for column, values in zip(columns, chunk):
+                column[index:index + count] = numpy.frombuffer(values, dtype=numpy.float64)
+            index += count
+            job.advance(count)
+
+        with open(job.filename, 'wb') as output:
+            numpy.savez(output, metadata=numpy.array(json.dumps(job.metadata)),
+                        **dict(zip(job.run_data.column_names, columns)))
+
+
+class ParquetFormat(ExportFormat):
+    '''
+    An Apache Parquet file with one row group per chunk of run data; the
+    metadata is a JSON string in the schema metadata
+    '''
+    name = "Parquet files"
+    extension = ".parquet"
+    requires = "pyarrow"
+
+
+    def write(self, job):
+        import pyarrow
+        import pyarrow.parquet
+
+        schema = pyarrow.schema(
+            [(name, pyarrow.float64()) for name in job.run_data.column_names],
+            metadata={"load_frame_controller": json.dumps(job.metadata)})
+        with pyarrow.parquet.ParquetWriter(job.filename, schema) as writer:
+            for chunk in job.run_data.chunks():
+                # wrap the chunk's memory rather than converting values
+                count = len(chunk[0])
+                arrays = [pyarrow.Array.from_buffers(pyarrow.float64(), count,
+                              [None, pyarrow.py_buffer(values)]) for values in chunk]
+                writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+                job.advance(count)
+
+
+class HDF5Format(ExportFormat):
+    '''
+    An HDF5 file with a compressed dataset per column; the metadata is a
+    JSON string in the metadata attribute of the root group
+    '''
+    name = "HDF5 files"
+    extension = ".h5"
+    requires = "h5py"
+
+
+    def write(self, job):
+        import h5py
+        import numpy
+
+        length = len(job.run_data)
+        with h5py.File(job.filename, 'w') as output:
+            output.attrs["metadata"] = json.dumps(job.metadata)
+            datasets = [output.create_dataset(name, (length,), dtype='f8',
+                                              compression='lzf', shuffle=True)
+                        for name in job.run_data.column_names]
+            index = 0
+            for chunk in job.run_data.chunks():
+                count = len(chunk[0])
+                for dataset, values in zip(datasets, chunk):
+                    dataset[index:index + count] = numpy.frombuffer(values, dtype=numpy.float64)
+                index += count
+                job.advance(count)
+
+
+# in the order offered by the save dialog
+export_formats = (CSVFormat, CompressedCSVFormat, NumPyFormat, ParquetFormat, HDF5Format)
+
+
+def available_export_formats():
+    '''
+    The export formats whose required libraries are installed
+    '''
+    return [export_format for export_format in export_formats if export_format.available()]
+
+
+class ExportJob:
+    '''
+    Write a snapshot of run data to a file in a worker thread
+
+    Progress and completion are reported through callbacks invoked on the
+    worker thread; GUI callers should hand them to their main loop.
+    '''
+
+    # bytes buffered by the file object between writes to the OS
+    buffer_size = 1 << 20
+
+
+    def __init__(self, run_data, filename, export_format=CSVFormat, metadata=None,
+                 on_progress=None, on_finished=None):
+        '''
+        Parameters
+        --------
+        run_data : rundata.RunDataView
+            the snapshot of run data to export
+        filename : str
+            the file to write; removed again if the export fails or is
+            cancelled
+        export_format : class
+            one of export_formats
+        metadata : dict
+            JSON serializable information about the run to store with it
+        on_progress : callable
+            invoked with the job and the fraction of samples written so far
+        on_finished : callable
+            invoked with the job once the export has completed, failed or
+            been cancelled; see the error and cancelled attributes
+        '''
+        self.run_data = run_data
+        self.filename = filename
+        self.export_format = export_format()
+        self.metadata = metadata or {}
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.samples_written = 0
+        self.error = None
+        self.cancelled = False
+        self._cancel = Event()
+        self._thread = None
+
+
+    def start(self):
+        '''
+        Start writing in a daemon thread
+        '''
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def cancel(self):
+        '''
+        Ask the export to stop as soon as possible
+        '''
+        self._cancel.set()
+
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def wait(self):
+        '''
+        Block until the export has finished
+        '''
+        if self._thread:
+            self._thread.join()
+
+
+    def advance(self, count):
+        '''
+        Called by the export format after writing count more samples
+
+        Raises
+        --------
+        ExportCancelled - if the export has been cancelled
+        '''
+        self.samples_written += count
+        if self._cancel.is_set():
+            raise ExportCancelled()
+        if self.on_progress:
+            total = len(self.run_data)
+            self.on_progress(self, self.samples_written / total if total else 1.0)
+
+
+    def _run(self):
+        '''
+        Write the file
+
+        Intended to be run as a thread
+        '''
+        try:
+            with registry.timer("export" + self.export_format.extension):
+                self.export_format.write(self)
+            registry.increment("export.samples", self.samples_written)
+        except ExportCancelled:
+            self.cancelled = True
+        except Exception as e:
+            # any failure, including from third party writers, must still
+            # clean up and report or the caller waits for ever
+            self.error = e
+        finally:
+            if self.cancelled or self.error:
+                for filename in self.export_format.files_written(self.filename):
+                    try:
+                        os.remove(filename)
+                    except OSError:
+                        pass
+
+            if self.on_finished:
+                self.on_finished(self)
@@ -0,0 +1,193 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from OS provided libraries e.g. python-gobject
+#   on Debian / Raspberry Pi OS install with `sudo apt install python3-gi-cairo`
+import cairo
+
+# Import from our module
+from .decimation import MinMaxDecimator
+
+'''
+Render a graph of load over time
+
+The curve is kept on an off-screen image surface. New samples are stroked
+onto the surface as short segments and the whole curve is only rendered
+again, from decimated data, when the axes must change or the canvas is
+resized. Most frames are therefore a single blit of the surface which
+matters where Gtk renders in software e.g. on a Raspberry Pi.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class GraphRenderer:
+    '''
+    Draw load against time from snapshots of a RunData instance onto a
+    cached cairo image surface
+    '''
+
+    # space in pixels around the plot area
+    margin = 10
+
+    # fraction of the current time span and load range left free beyond the
+    # data so the axes need not change with every new sample
+    time_headroom = 0.5
+    load_headroom = 0.1
+
+    line_width = 0.5
+
+
+    def __init__(self):
+        self.decimator = MinMaxDecimator()
+        self.full_renders = 0
+        self.incremental_renders = 0
+        self._surface = None
+        self._size = None
+        self._axes = None  # (time_min, time_max, load_min, load_max)
+        self._window = None
+        self._generation = None
+        self._drawn = 0
+        self._last_point = None
+
+
+    def invalidate(self):
+        '''
+        Force the next draw to render the whole curve from scratch e.g. after
+        switching to a different store
+        '''
+        self._axes = None
+        self.decimator.reset()
+
+
+    def draw(self, cr, width, height, run_data, window=None):
+        '''
+        Draw the graph
+
+        Parameters
+        --------
+        cr : cairo.Context
+            the context to draw with
+        width, height : int
+            the size of the canvas in pixels
+        run_data : rundata.RunDataView
+            a snapshot of the data to plot holding at least two samples
+        window : float
+            the number of seconds of data the snapshot is limited to or None
+            if the snapshot covers the whole run
+        '''
+        if (self._size != (width, height) or self._generation != run_data.generation
+                or not self._fits(run_data)):
+            self._render(width, height, run_data, window)
+        else:
+            self._extend(run_data)
+
+        cr.set_source_surface(self._surface, 0, 0)
+        cr.paint()
+
+
+    def _fits(self, run_data):
+        # can the snapshot be drawn without changing the axes?
+        if self._axes is None or run_data.stop < self._drawn:
+            return False
+        time_min, time_max, load_min, load_max = self._axes
+        return (run_data[-1][0] <= time_max and run_data[0][0] >= time_min
+                and load_min <= run_data.load_min and run_data.load_max <= load_max)
+
+
+    def _choose_axes(self, run_data, window):
+        time_last = run_data[-1][0]
+        if window is None:
+            time_min = run_data[0][0]
+            span = max(time_last - time_min, 1.0)
+        else:
+            time_min = time_last - window
+            span = window
+        time_max = time_min + span * (1 + self.time_headroom)
+
+        load_range = run_data.load_max - run_data.load_min
+        if 0 >= load_range:
+            load_range = max(abs(run_data.load_max), 1.0)
+        padding = load_range * self.load_headroom
+        self._axes = (time_min, time_max,
+                      run_data.load_min - padding, run_data.load_max + padding)
+
+
+    def _to_canvas(self, time, load):
+        time_min, _time_max, load_min, _load_max = self._axes
+        return (self.margin + (time - time_min) * self._h_scale,
+                self._top - (load - load_min) * self._v_scale)
+
+
+    def _context(self):
+        cr = cairo.Context(self._surface)
+        cr.set_source_rgb(0, 0, 0)
+        cr.set_line_width(self.line_width)
+        return cr
+
+
+    def _render(self, width, height, run_data, window):
+        if self._size != (width, height) or self._surface is None:
+            self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            self._size = (width, height)
+        self._generation = run_data.generation
+        self._window = window
+        self._choose_axes(run_data, window)
+
+        plot_width = width - 2 * self.margin
+        plot_height = height - 2 * self.margin
+        time_min, time_max, load_min, load_max = self._axes
+        self._h_scale = plot_width / (time_max - time_min)
+        self._v_scale = plot_height / (load_max - load_min)
+
+        # drawing area is y-inverted
+        self._top = plot_height + self.margin
+
+        cr = self._context()
+        cr.set_operator(cairo.OPERATOR_CLEAR)
+        cr.paint()
+        cr.set_operator(cairo.OPERATOR_OVER)
+
+        # only draw a few points per pixel regardless of run length
+        points = self.decimator.update(run_data, plot_width)
+        cr.move_to(*self._to_canvas(*run_data[0][:2]))
+        for time, load in points:
+            cr.line_to(*self._to_canvas(time, load))
+        self._last_point = cr.get_current_point()
+        cr.stroke()
+
+        self._drawn = run_data.stop
+        self.full_renders += 1
+
+
+    def _extend(self, run_data):
+        if run_data.stop == self._drawn:
+            return
+
+        # a long backlog is cheaper to draw decimated
+        if run_data.stop - self._drawn > 4 * self._size[0]:
+            self._render(self._size[0], self._size[1], run_data, self._window)
+            return
+
+        cr = self._context()
+        cr.move_to(*self._last_point)
+        for times, loads, _extensions in run_data.chunks(self._drawn - run_data.start):
+            for time, load in zip(times, loads):
+                cr.line_to(*self._to_canvas(time, load))
+        self._last_point = cr.get_current_point()
+        cr.stroke()
+
+        self._drawn = run_data.stop
+        self.incremental_renders += 1
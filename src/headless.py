@@ -0,0 +1,320 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import argparse
+import signal
+import sys
+from threading import Event
+from time import monotonic, sleep, time
+
+# Import from our module
+from .acquisition import Acquisition
+from .instrumentation import registry
+from .recorder import StreamRecorder
+from .tiniusolsen import TiniusOlsen1000Series, TiniusOlsenH5KSeries
+
+'''
+Run a test without the GUI
+
+Connects to a load frame, optionally zeroes it and starts it moving, then
+records samples to a file (see recorder.py) until interrupted, terminated or
+a stop condition is met e.g.
+
+    load_frame_controller --headless --model h5k --port /dev/ttyUSB0 \
+        --sample-rate 10 --run-rate 5 --direction up --max-extension 25 \
+        --output trial.lfr
+
+Gtk is never imported so this starts quickly and runs on machines without a
+display e.g. as a systemd service on a Raspberry Pi.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+models = {
+    "h5k": TiniusOlsenH5KSeries,
+    "1000": TiniusOlsen1000Series
+}
+
+
+class StopConditions:
+    '''
+    Decide from each sample whether a test is over
+
+    Conditions which are None are not checked.
+    '''
+
+    def __init__(self, duration=None, max_load=None, max_extension=None, break_fraction=None,
+                 minimum_peak=0.0):
+        '''
+        Parameters
+        --------
+        duration : float
+            seconds after the first sample to stop
+        max_load : float
+            stop once the magnitude of the load, in Newtons, reaches this
+        max_extension : float
+            stop once the magnitude of the extension reaches this
+        break_fraction : float
+            stop once the load falls below this fraction of its peak, as
+            when a specimen breaks
+        minimum_peak : float
+            the load, in Newtons, the peak must exceed before
+            break_fraction is checked so noise isn't taken for a break
+        '''
+        self.duration = duration
+        self.max_load = max_load
+        self.max_extension = max_extension
+        self.break_fraction = break_fraction
+        self.minimum_peak = minimum_peak
+        self.reason = None
+        self._first_time = None
+        self._peak_load = 0.0
+
+
+    def check(self, time, load, extension):
+        '''
+        Returns
+        --------
+        bool - True if the test should stop; see reason
+        '''
+        if self._first_time is None:
+            self._first_time = time
+        self._peak_load = max(self._peak_load, abs(load))
+
+        if self.duration is not None and time - self._first_time >= self.duration:
+            self.reason = "ran for {:g} s".format(self.duration)
+        elif self.max_load is not None and abs(load) >= self.max_load:
+            self.reason = "load reached {:g} N".format(load)
+        elif self.max_extension is not None and abs(extension) >= self.max_extension:
+            self.reason = "extension reached {:g}".format(extension)
+        elif (self.break_fraction is not None and self.minimum_peak < self._peak_load
+                and abs(load) < self.break_fraction * self._peak_load):
+            self.reason = "load fell to {:g} N from a peak of {:g} N".format(load, self._peak_load)
+        return self.reason is not None
+
+
+class HeadlessRun:
+    '''
+    Acquire from a load frame to a recording until told to stop
+    '''
+
+    def __init__(self, machine, recorder, conditions, polling_interval=1, free_run=False,
+                 realtime=False, align_extension=False):
+        self.machine = machine
+        self.recorder = recorder
+        self.conditions = conditions
+        self.samples = 0
+        self.latest = None
+        self.stopped = Event()
+        self.acquisition = Acquisition(machine, self._sample_acquired,
+                                       machine.get_load_cell_range(), polling_interval,
+                                       self._state_changed)
+        self.acquisition.set_free_run(free_run)
+        self.acquisition.realtime = realtime
+        self.acquisition.lock_memory = realtime
+        self.acquisition.align_extension = align_extension
+
+
+    def _sample_acquired(self, now, load, extension):
+        # called on the acquisition thread
+        if self.stopped.is_set():
+            return
+        self.recorder.record(now, load, extension)
+        self.samples += 1
+        self.latest = (now, load, extension)
+        if self.conditions.check(now, load, extension):
+            self.stopped.set()
+
+
+    def _state_changed(self, state, error):
+        # called on the acquisition thread; polling resumes by itself
+        if Acquisition.DISCONNECTED == state:
+            print("Lost connection to the load frame, reconnecting: {}".format(error))
+        else:
+            print("Reconnected to the load frame")
+        sys.stdout.flush()
+
+
+    def stop(self, reason):
+        if not self.stopped.is_set():
+            self.conditions.reason = reason
+            self.stopped.set()
+
+
+    def run(self, start_moving=None, status_interval=None):
+        '''
+        Acquire until stop() is called or a stop condition is met
+
+        Parameters
+        --------
+        start_moving : callable
+            called once acquisition has started e.g. machine.start_moving_up
+        status_interval : float
+            seconds between progress lines printed to stdout or None
+        '''
+        self.acquisition.start()
+        try:
+            if self.acquisition.realtime:
+                # enabled as the polling thread starts; let it report
+                sleep(0.1)
+                if self.acquisition.realtime_error:
+                    print("Polling without real time priority: {}".format(
+                        self.acquisition.realtime_error))
+            if start_moving:
+                start_moving()
+            while not self.stopped.wait(status_interval):
+                if self.recorder.error:
+                    self.stop("recording failed: {}".format(self.recorder.error))
+                elif self.latest:
+                    print("{} samples at {:.1f} Hz; load {:.3f} N extension {:.3f}".format(
+                        self.samples, self.acquisition.rate_meter.rate(), *self.latest[1:]))
+                    sys.stdout.flush()
+        finally:
+            try:
+                self.machine.stop_moving()
+            finally:
+                # even if the link has gone, stop feeding the recorder
+                self.acquisition.stop()
+
+
+def main(argv=None):
+    '''
+    Run a test from the command line
+
+    Returns
+    --------
+    int - the exit status; 0 if the test ran until a stop condition or
+        signal, 1 if the load frame could not be used or recording failed
+    '''
+    parser = argparse.ArgumentParser(prog="load_frame_controller --headless",
+                                     description="Record a load frame test without the GUI")
+    parser.add_argument("--model", choices=sorted(models), required=True)
+    parser.add_argument("--port", required=True, help="serial port e.g. /dev/ttyUSB0")
+    parser.add_argument("--output", required=True, help="recording to write e.g. trial.lfr")
+    rate = parser.add_mutually_exclusive_group()
+    rate.add_argument("--sample-rate", type=float, default=1.0, help="samples per second")
+    rate.add_argument("--free-run", action="store_true", help="sample as fast as the serial link allows")
+    parser.add_argument("--run-rate", type=float, help="crosshead speed to set before starting")
+    parser.add_argument("--direction", choices=("up", "down", "none"), default="none",
+                        help="move the crosshead while recording")
+    parser.add_argument("--zero", action="store_true", help="zero load and extension before starting")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--max-load", type=float, help="stop when the load reaches this many Newtons")
+    parser.add_argument("--max-extension", type=float, help="stop when the extension reaches this")
+    parser.add_argument("--break-fraction", type=float,
+                        help="stop when the load falls below this fraction of its peak e.g. 0.5")
+    parser.add_argument("--align-extension", action="store_true",
+                        help="interpolate extension to the instant load was measured")
+    parser.add_argument("--realtime", action="store_true",
+                        help="poll from a SCHED_FIFO thread with memory locked; needs privileges")
+    parser.add_argument("--status-interval", type=float, default=10,
+                        help="seconds between progress lines; 0 for none")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="collect performance statistics and write them to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    if args.sample_rate <= 0:
+        parser.error("--sample-rate must be positive")
+    if args.stats:
+        registry.enabled = True
+
+    try:
+        machine = models[args.model](args.port)
+    except (IOError, LookupError, TimeoutError) as e:
+        print("Unable to use the load frame on {}: {}".format(args.port, e), file=sys.stderr)
+        return 1
+    try:
+        return _record(args, machine)
+    finally:
+        # release the port and the driver's thread however the run ended
+        try:
+            machine.close()
+        except IOError as e:
+            print("Unable to stop the load frame on {}: {}".format(args.port, e), file=sys.stderr)
+
+
+def _record(args, machine):
+    '''
+    Prepare a connected load frame then record until a stop condition
+
+    Returns
+    --------
+    int - the exit status for main
+    '''
+    try:
+        load_cell_range = machine.get_load_cell_range()
+        if args.zero:
+            for future in (machine.zero_load_async(), machine.zero_extension_async()):
+                future.result()
+        if args.run_rate is not None:
+            machine.set_run_rate(args.run_rate)
+    except (IOError, LookupError, TimeoutError) as e:
+        print("Unable to use the load frame on {}: {}".format(args.port, e), file=sys.stderr)
+        return 1
+
+    metadata = {
+        "model": args.model,
+        "load_cell_range": load_cell_range,
+        "run_rate": args.run_rate,
+        "sampling_rate": None if args.free_run else args.sample_rate,
+        "free_run": args.free_run,
+        "extension_aligned_to_load": args.align_extension,
+        "started": time(),
+        # add to a sample time to get seconds since the epoch
+        "time_offset": time() - monotonic()
+    }
+    for offset in ("zero_load_offset", "zero_extension_offset"):
+        if hasattr(machine, offset):
+            metadata[offset] = getattr(machine, offset)
+    try:
+        recorder = StreamRecorder(args.output, metadata)
+    except IOError as e:
+        print("Unable to record to {}: {}".format(args.output, e), file=sys.stderr)
+        return 1
+
+    # a break is only looked for once the load has risen clear of noise
+    conditions = StopConditions(args.duration, args.max_load, args.max_extension,
+                                args.break_fraction, 0.02 * load_cell_range)
+    run = HeadlessRun(machine, recorder, conditions, 1 / args.sample_rate, args.free_run,
+                      args.realtime, args.align_extension)
+    for signal_number in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signal_number,
+            lambda number, _frame: run.stop("received {}".format(signal.Signals(number).name)))
+
+    registry.add_source("link", machine.link_statistics)
+    registry.add_source("transport", lambda: machine.transport.statistics())
+    registry.add_source("stop_latency_p99", machine.stop_latency)
+    registry.add_source("schedule", run.acquisition.schedule_statistics)
+
+    start_moving = {"up": machine.start_moving_up, "down": machine.start_moving_down}
+    try:
+        run.run(start_moving.get(args.direction), args.status_interval or None)
+    finally:
+        recorder.close()
+        if args.stats:
+            try:
+                registry.dump(args.stats)
+            except IOError as e:
+                print("Unable to write statistics to {}: {}".format(args.stats, e), file=sys.stderr)
+
+    print("Stopped: {}; recorded {} samples to {}".format(
+        conditions.reason, recorder.samples_written, args.output))
+    return 1 if recorder.error else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from bisect import bisect_left
+from contextlib import nullcontext
+import json
+import os
+from threading import Lock
+from time import perf_counter, time
+
+'''
+Counters and histograms for the acquisition hot path
+
+Code on the hot path asks the registry for a named counter, histogram or
+timer as it runs e.g.
+
+    with registry.timer("driver.read_sample"):
+        ...
+
+When the registry is disabled, the default unless the environment variable
+LOAD_FRAME_CONTROLLER_STATS is set, increment and record return at once and
+timer returns a shared do-nothing context so instrumented code costs little
+more than the call. Statistics kept elsewhere, e.g. the serial transport's
+per command counters, are included by registering a source.
+
+Nothing in this module depends on Gtk.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class Histogram:
+    '''
+    Count values in buckets with fixed upper bounds
+
+    Cheap enough to update for every sample; a value is counted in the first
+    bucket whose bound it doesn't exceed or in a final overflow bucket.
+    '''
+
+    def __init__(self, bounds):
+        '''
+        Parameters
+        --------
+        bounds : list
+            the ascending upper bounds of the buckets
+        '''
+        self.bounds = list(bounds)
+        self.reset()
+
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+
+    def percentile(self, percentile):
+        '''
+        Get the upper bound of the bucket holding a percentile of the values
+        recorded, the largest value if it is in the overflow bucket, or
+        None if nothing has been recorded
+        '''
+        if 0 == self.count:
+            return None
+        rank = percentile / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank and 0 < seen:
+                return bound
+        return self.maximum
+
+
+    def as_dict(self):
+        return {
+            "bounds": self.bounds,
+            "counts": self.counts,
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.minimum,
+            "max": self.maximum,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99)
+        }
+
+
+# bucket bounds in seconds for durations from microseconds to seconds
+duration_bounds = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005,
+                   0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class Counter:
+    '''
+    A count which only goes up until reset
+    '''
+
+    __slots__ = ("value",)
+
+
+    def __init__(self):
+        self.value = 0
+
+
+    def increment(self, amount=1):
+        self.value += amount
+
+
+class _Timer:
+    # records the duration of a with block in a histogram
+
+    __slots__ = ("histogram", "start")
+
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+
+    def __exit__(self, *_args):
+        self.histogram.record(perf_counter() - self.start)
+
+
+_disabled_timer = nullcontext()
+
+
+class _TimedLock:
+    # holds a lock for a with block, recording how long taking it took
+
+    __slots__ = ("lock", "histogram")
+
+
+    def __init__(self, lock, histogram):
+        self.lock = lock
+        self.histogram = histogram
+
+
+    def __enter__(self):
+        start = perf_counter()
+        self.lock.acquire()
+        self.histogram.record(perf_counter() - start)
+        return self
+
+
+    def __exit__(self, *_args):
+        self.lock.release()
+
+
+class Registry:
+    '''
+    Named counters, histograms and sources of statistics
+
+    Counters and histograms are created on first use. Updates are not
+    locked; like the rest of the statistics in this application they may
+    very occasionally lose an update to a race, which is preferred to
+    taking a lock for every sample.
+    '''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._sources = {}
+        self._lock = Lock()  # guards creating entries, not updating them
+
+
+    def counter(self, name):
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, Counter())
+        return counter
+
+
+    def histogram(self, name, bounds=duration_bounds):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(bounds))
+        return histogram
+
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            self.counter(name).increment(amount)
+
+
+    def record(self, name, value, bounds=duration_bounds):
+        if self.enabled:
+            self.histogram(name, bounds).record(value)
+
+
+    def timer(self, name):
+        '''
+        Get a context manager recording how long its block takes, in
+        seconds, in the named histogram
+        '''
+        if self.enabled:
+            return _Timer(self.histogram(name))
+        return _disabled_timer
+
+
+    def locked(self, lock, name):
+        '''
+        Get a context manager holding lock for its block and recording how
+        long taking it took, in seconds, in the named histogram
+
+        enabled is read once so switching collection on or off from another
+        thread can't leave the block half instrumented.
+        '''
+        if self.enabled:
+            return _TimedLock(lock, self.histogram(name))
+        return lock
+
+
+    def add_source(self, name, source):
+        '''
+        Include statistics kept elsewhere in snapshots
+
+        Parameters
+        --------
+        name : str
+            replaces any source already added with this name
+        source : callable
+            returning a JSON serializable value e.g. a dictionary of counters
+        '''
+        with self._lock:
+            self._sources[name] = source
+
+
+    def remove_source(self, name):
+        with self._lock:
+            self._sources.pop(name, None)
+
+
+    def reset(self):
+        '''
+        Forget all counters and histograms; sources are kept
+        '''
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+
+    def snapshot(self):
+        '''
+        Get the current value of everything in the registry
+
+        Returns
+        --------
+        dict - of counters, histograms and sources; a source which fails is
+            reported as the error it raised
+        '''
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+            sources = dict(self._sources)
+        collected = {}
+        for name, source in sorted(sources.items()):
+            try:
+                collected[name] = source()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {
+            "enabled": self.enabled,
+            "timestamp": time(),
+            "counters": {name: counter.value for name, counter in sorted(counters.items())},
+            "histograms": {name: histogram.as_dict() for name, histogram in sorted(histograms.items())},
+            "sources": collected
+        }
+
+
+    def dump(self, path):
+        '''
+        Write a snapshot to a file as JSON
+
+        Raises
+        --------
+        IOError - if the file can not be written
+        '''
+        with open(path, 'w') as dump_file:
+            json.dump(self.snapshot(), dump_file, indent=2)
+
+
+# the registry used throughout the application
+registry = Registry("LOAD_FRAME_CONTROLLER_STATS" in os.environ)
@@ -10,10 +10,16 @@
 
 # Import from Python Standard Library
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import Future
+from time import monotonic
 
 '''
 Interface for working with load frames
 
+LoadFrame is the blocking interface; AsyncLoadFrame is the same interface
+for use from an asyncio event loop.
+
 License
 --------
 Apache 2.0 License (See Also LICENSE file)
@@ -23,6 +29,26 @@ Author
 Tom Egan <tom@tomegan.tech>
 '''
 
+Sample = namedtuple("Sample", ("time", "load", "extension", "load_time", "extension_time"),
+                    defaults=(None, None))
+Sample.__doc__ = '''
+A single reading of load and extension
+
+time is the value of time.monotonic() at which the reading was taken, load and
+extension are in the units returned by LoadFrame.read_load and
+LoadFrame.read_extension respectively. load_time and extension_time are the
+best estimates of when each was measured, which may differ by as much as a
+round trip to the controller; time is the same as load_time where known.
+'''
+
+
+class ConnectionLost(IOError):
+    '''
+    Raised when a load frame stops replying usefully even after retries e.g.
+    because its cable has been pulled; see LoadFrame.reconnect
+    '''
+
+
 class LoadFrame(ABC):
     '''
     An abstract base class that defines an interface we expect we can implement
@@ -59,6 +85,26 @@ class LoadFrame(ABC):
         pass
 
 
+    def read_sample(self):
+        '''
+        Get the current load and extension with a single timestamp
+
+        Implementations should override this method if the load frame can
+        be asked for both values in less time than two separate reads.
+
+        Returns
+        --------
+        Sample - a namedtuple of time, load and extension; each reading is
+            taken to be measured half way through its read
+        '''
+        start = monotonic()
+        load = self.read_load()
+        middle = monotonic()
+        extension = self.read_extension()
+        load_time = (start + middle) / 2
+        return Sample(load_time, load, extension, load_time, (middle + monotonic()) / 2)
+
+
     @abstractmethod
     def set_run_rate(self, rate):
         pass
@@ -86,4 +132,177 @@ class LoadFrame(ABC):
 
     @abstractmethod
     def zero_load(self):
-        pass
\ No newline at end of file
+        pass
+
+
+    def zero_extension_async(self):
+        '''
+        Zero the extension without waiting for the load frame to finish
+
+        Implementations should override this method if zeroing takes long
+        enough to hold up the caller.
+
+        Returns
+        --------
+        concurrent.futures.Future - done once the extension has been zeroed
+        '''
+        return _run_now(self.zero_extension)
+
+
+    def zero_load_async(self):
+        '''
+        Zero the load without waiting for the load frame to finish
+
+        Implementations should override this method if zeroing takes long
+        enough to hold up the caller.
+
+        Returns
+        --------
+        concurrent.futures.Future - done once the load has been zeroed
+        '''
+        return _run_now(self.zero_load)
+
+
+    def stop_latency(self, percentile=99):
+        '''
+        Get a percentile of the time, in seconds, recent stop commands took
+        to be acknowledged
+
+        Returns
+        --------
+        float - or None if not measured by the implementation
+        '''
+        return None
+
+
+    def link_statistics(self):
+        '''
+        Get counters describing the health of the connection e.g. timeouts
+        and retries
+
+        Returns
+        --------
+        dict - empty if not measured by the implementation
+        '''
+        return {}
+
+
+    def reconnect(self):
+        '''
+        Connect again after ConnectionLost; the load frame is not stopped or
+        otherwise reconfigured
+
+        Raises
+        --------
+        IOError - if the load frame still can't be reached
+        NotImplementedError - if the implementation can't reconnect
+        '''
+        raise NotImplementedError()
+
+
+def _run_now(function):
+    # a future for a call which is quick enough to make immediately
+    future = Future()
+    future.set_running_or_notify_cancel()
+    try:
+        future.set_result(function())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class AsyncLoadFrame(ABC):
+    '''
+    An abstract base class defining the LoadFrame interface for asyncio;
+    each method is a coroutine
+    '''
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *_args):
+        await self.close()
+
+
+    @abstractmethod
+    async def close(self):
+        '''
+        Stop the load frame if it is moving and release the connection
+        '''
+        pass
+
+
+    @abstractmethod
+    async def get_load_cell_range(self):
+        '''
+        Get the rated range for the load cell in Newtons (N)
+
+        Raises
+        --------
+        LookupError if the machine reports a load cell of an unknown type
+            is in use or does not respond to request to read configuration
+        '''
+        pass
+
+
+    @abstractmethod
+    async def read_extension(self):
+        '''
+        Get the current extension in Millimeters (mm)
+        '''
+        pass
+
+
+    @abstractmethod
+    async def read_load(self):
+        '''
+        Get the current load in Newtons (N)
+        '''
+        pass
+
+
+    async def read_sample(self):
+        '''
+        Get the current load and extension with a single timestamp
+
+        Implementations should override this method if the load frame can
+        be asked for both values in less time than two separate reads.
+
+        Returns
+        --------
+        Sample - a namedtuple of time, load and extension
+        '''
+        now = monotonic()
+        return Sample(now, await self.read_load(), await self.read_extension())
+
+
+    @abstractmethod
+    async def set_run_rate(self, rate):
+        pass
+
+
+    @abstractmethod
+    async def start_moving_up(self):
+        pass
+
+
+    @abstractmethod
+    async def start_moving_down(self):
+        pass
+
+
+    @abstractmethod
+    async def stop_moving(self):
+        pass
+
+
+    @abstractmethod
+    async def zero_extension(self):
+        pass
+
+
+    @abstractmethod
+    async def zero_load(self):
+        pass
@@ -0,0 +1,217 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from collections import namedtuple
+import json
+import os
+from threading import Event, Lock, Thread
+
+# Import from third party libraries
+from serial.tools.list_ports import comports
+
+'''
+Discover serial ports in the background
+
+Listing serial ports means reading many files in sysfs so it is done on a
+background thread, and only when a device node has been added to or
+removed from /dev, which is checked cheaply by looking at the directory's
+modification time. Details of each port seen, including the model of load
+frame last connected through it, are cached so they are known as soon as an
+adapter is plugged back in.
+
+Nothing in this module depends on Gtk.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+PortInfo = namedtuple("PortInfo", ("device", "name", "description", "vid", "pid",
+                                   "serial_number", "last_model"))
+PortInfo.__doc__ = '''
+A serial port along with the USB details of its adapter, if any, and the
+model of load frame last connected through it or None
+'''
+
+
+def default_cache_path():
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "load_frame_controller", "ports.json")
+
+
+class PortCache:
+    '''
+    Details of serial ports seen before, persisted as JSON
+
+    Ports are identified by USB vendor, product and serial number when known
+    so an adapter is recognised whichever device name it is given.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_path()
+        self._lock = Lock()
+        try:
+            with open(self.path) as cache_file:
+                self._entries = json.load(cache_file)
+        except (IOError, ValueError):
+            self._entries = {}
+
+
+    @staticmethod
+    def key(port):
+        if port.vid is not None:
+            return "{:04x}:{:04x}:{}".format(port.vid, port.pid, port.serial_number or "")
+        return port.device
+
+
+    def last_model(self, port):
+        with self._lock:
+            return self._entries.get(self.key(port), {}).get("last_model")
+
+
+    def remember(self, port, model=None):
+        '''
+        Record the details of a port and optionally the model of load frame
+        connected through it
+        '''
+        with self._lock:
+            entry = self._entries.setdefault(self.key(port), {})
+            entry.update(device=port.device, description=port.description,
+                         vid=port.vid, pid=port.pid, serial_number=port.serial_number)
+            if model is not None:
+                entry["last_model"] = model
+            self._save()
+
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", 'w') as cache_file:
+                json.dump(self._entries, cache_file, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+        except (IOError, OSError) as e:
+            # the cache is only an optimisation
+            print("Unable to save port cache: {}".format(e))
+
+
+class PortWatcher:
+    '''
+    Watch for serial ports being added and removed from a background thread
+
+    The callbacks are invoked on the watcher's thread with a PortInfo; GUI
+    callers should hand them to their main loop.
+    '''
+
+    # seconds between checks for changes to /dev
+    poll_interval = 1.0
+
+    watched_directory = "/dev"
+
+
+    def __init__(self, on_added, on_removed, cache=None):
+        '''
+        Parameters
+        --------
+        on_added : callable
+            invoked with the PortInfo of each port found, including those
+            present when the watcher starts
+        on_removed : callable
+            invoked with the PortInfo of each port which disappears
+        cache : PortCache
+            where port details are remembered
+        '''
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.cache = cache or PortCache()
+        self.ports = {}  # device name to PortInfo
+        self.scans = 0
+        self._directory_mtime = None
+        self._rescan = Event()
+        self._stop = Event()
+        self._thread = None
+
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._rescan.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+    def rescan(self):
+        '''
+        List the ports again as soon as possible whether or not /dev has
+        changed
+        '''
+        self._rescan.set()
+
+
+    def remember_model(self, device, model):
+        '''
+        Record that a load frame of a model was connected through a port
+        '''
+        port = self.ports.get(device)
+        if port is not None:
+            self.cache.remember(port, model)
+            self.ports[device] = port._replace(last_model=model)
+
+
+    def _changed(self):
+        try:
+            mtime = os.stat(self.watched_directory).st_mtime_ns
+        except OSError:
+            # nothing to watch; list every time
+            return True
+        changed = mtime != self._directory_mtime
+        self._directory_mtime = mtime
+        return changed
+
+
+    def _scan(self):
+        found = {}
+        for port in comports():
+            info = PortInfo(port.device, port.name, port.description, port.vid, port.pid,
+                            port.serial_number, None)
+            found[port.device] = info._replace(last_model=self.cache.last_model(info))
+        self.scans += 1
+
+        for device in list(self.ports):
+            if device not in found:
+                self.on_removed(self.ports.pop(device))
+        for device, info in found.items():
+            if device not in self.ports:
+                self.ports[device] = info
+                if info.vid is not None:
+                    self.cache.remember(info)
+                self.on_added(info)
+
+
+    def _watch(self):
+        '''
+        Intended to be run as a thread
+        '''
+        while not self._stop.is_set():
+            forced = self._rescan.is_set()
+            self._rescan.clear()
+            if self._changed() or forced:
+                self._scan()
+            self._rescan.wait(self.poll_interval)
@@ -0,0 +1,244 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from array import array
+import argparse
+import csv
+import json
+import os
+from queue import Empty, SimpleQueue
+import struct
+import sys
+from threading import Thread
+from time import monotonic
+from zlib import crc32
+
+# Import from our module
+from .rundata import RunData
+
+'''
+Crash safe recording of run data while it is acquired
+
+Samples are queued by the acquisition thread and appended to a file, in
+batches, by a background thread which regularly flushes the file to disk. If
+the application crashes or power is lost, at most the last few seconds of
+data are missing and the run can be rebuilt from the file e.g.
+
+    python3 -m load_frame_controller.recorder trial.lfr trial.csv
+
+File format; all numbers are little endian
+    magic               b'LFCREC\\x01\\n'
+    metadata length     uint32
+    metadata            JSON encoded as UTF-8
+    batches...
+        sample count    uint32
+        crc32           uint32 of the samples
+        samples         count x (time, load, extension) as doubles
+
+A batch that is truncated or fails its CRC ends the recovered run.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+magic = b'LFCREC\x01\n'
+_length = struct.Struct('<I')
+_batch_header = struct.Struct('<II')
+_fields_per_sample = 3
+
+
+def _to_little_endian(samples):
+    if 'big' == sys.byteorder:
+        samples.byteswap()
+    return samples
+
+
+class StreamRecorder:
+    '''
+    Append samples to a file from a background thread
+
+    record() never blocks so it is safe to call from the acquisition thread.
+    '''
+
+    # the largest number of samples written at once
+    batch_size = 1024
+
+    # the longest time in seconds data may sit in the queue or the operating
+    # system's buffers before being written and flushed to disk
+    fsync_interval = 1.0
+
+
+    def __init__(self, path, metadata=None):
+        '''
+        Create the file and start the writer thread
+
+        Parameters
+        --------
+        path : str
+            the file to record to; any existing file is replaced
+        metadata : dict
+            JSON serializable information about the run e.g. the model of
+            load frame, stored at the start of the file
+
+        Raises
+        --------
+        IOError - if the file can not be created
+        '''
+        self.path = path
+        self.samples_written = 0
+        self.batches_written = 0
+        self.syncs = 0
+        self.error = None
+
+        self._file = open(path, 'wb')
+        header = json.dumps(metadata or {}).encode('utf-8')
+        self._file.write(magic + _length.pack(len(header)) + header)
+        self._sync()
+
+        self._queue = SimpleQueue()
+        self._thread = Thread(target=self._write_batches, daemon=True)
+        self._thread.start()
+
+
+    def record(self, time, load, extension):
+        '''
+        Queue a sample for writing without blocking
+        '''
+        self._queue.put((time, load, extension))
+
+
+    def close(self):
+        '''
+        Write any queued samples, flush them to disk and close the file
+        '''
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.syncs += 1
+
+
+    def _write_batch(self, batch):
+        samples = array('d')
+        for sample in batch:
+            samples.extend(sample)
+        payload = _to_little_endian(samples).tobytes()
+        self._file.write(_batch_header.pack(len(batch), crc32(payload)) + payload)
+        self.samples_written += len(batch)
+        self.batches_written += 1
+
+
+    def _write_batches(self):
+        '''
+        Take samples from the queue and write them in batches
+
+        Intended to be run as a thread
+        '''
+        next_sync = monotonic() + self.fsync_interval
+        closing = False
+        try:
+            while not closing:
+                batch = []
+                try:
+                    sample = self._queue.get(timeout=max(0, next_sync - monotonic()))
+                    while sample is not None:
+                        batch.append(sample)
+                        if len(batch) >= self.batch_size:
+                            break
+                        sample = self._queue.get_nowait()
+                    closing = sample is None
+                except Empty:
+                    pass
+
+                if batch:
+                    self._write_batch(batch)
+                if closing or monotonic() >= next_sync:
+                    self._sync()
+                    next_sync = monotonic() + self.fsync_interval
+        except (IOError, OSError) as e:
+            # leave the error for the owner to report; samples are dropped
+            self.error = e
+        finally:
+            self._file.close()
+
+
+def recover(path):
+    '''
+    Rebuild a run from a recording, which may have been cut short
+
+    Parameters
+    --------
+    path : str
+        the file written by a StreamRecorder
+
+    Returns
+    --------
+    tuple - the metadata dictionary and a RunData instance holding every
+        sample in the complete, uncorrupted batches of the file
+
+    Raises
+    --------
+    ValueError - if the file is not a recording
+    '''
+    run_data = RunData()
+    with open(path, 'rb') as recording:
+        if recording.read(len(magic)) != magic:
+            raise ValueError("{} is not a load frame recording".format(path))
+        header = recording.read(_length.size)
+        if len(header) < _length.size:
+            raise ValueError("{} is truncated".format(path))
+        metadata = json.loads(recording.read(_length.unpack(header)[0]).decode('utf-8'))
+
+        while True:
+            header = recording.read(_batch_header.size)
+            if len(header) < _batch_header.size:
+                break
+            count, checksum = _batch_header.unpack(header)
+            payload = recording.read(count * _fields_per_sample * 8)
+            if len(payload) < count * _fields_per_sample * 8 or crc32(payload) != checksum:
+                break
+            samples = _to_little_endian(array('d', payload))
+            for index in range(0, len(samples), _fields_per_sample):
+                run_data.append(*samples[index:index + _fields_per_sample])
+
+    return metadata, run_data
+
+
+def main(argv=None):
+    '''
+    Convert a recording, which may have been cut short, to a CSV file
+    '''
+    parser = argparse.ArgumentParser(description="Recover run data from a load frame recording")
+    parser.add_argument("recording", help="file written while acquiring data")
+    parser.add_argument("output", help="CSV file to write the recovered run to")
+    args = parser.parse_args(argv)
+
+    metadata, run_data = recover(args.recording)
+    with open(args.output, 'w') as csvfile:
+        spamwriter = csv.writer(csvfile)
+        spamwriter.writerow(("Time", "Load (N)", "Extension (mm)"))
+        spamwriter.writerows(run_data.snapshot().rows())
+    print("Recovered {} samples {} to {}".format(len(run_data), metadata, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from array import array
+from bisect import bisect_left
+from collections import deque
+import mmap
+import os
+import sys
+import tempfile
+
+'''
+Storage for the data collected during a run
+
+Samples are stored in columns of unboxed doubles, split into preallocated
+fixed size chunks so appending never copies data and snapshots can share the
+chunks with the store rather than copying them.
+
+The store keeps the range of the load as samples are appended so plotting
+doesn't need to scan the data. The range can be limited to a window covering
+the last few seconds of the run.
+
+For runs lasting days, MappedRunData keeps the chunks in a memory mapped
+temporary file instead so the memory used stays flat; the operating system
+writes the pages out and reads them back in as they are used.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class RunDataView:
+    '''
+    An immutable view of a contiguous range of the samples in a RunData
+    instance along with the range of the load over those samples
+
+    Views are cheap to create and remain valid, and unchanged, while more
+    samples are appended to or the store is cleared.
+    '''
+
+    column_names = ("time", "load", "extension")
+
+
+    def __init__(self, chunks, start, stop, chunk_size, load_min, load_max, generation):
+        self._chunks = chunks
+        self._start = start
+        self._length = stop - start
+        self._chunk_size = chunk_size
+        self.load_min = load_min
+        self.load_max = load_max
+
+        # the indices of the first and one past the last sample of the view
+        # within the store and the generation of the store when the view
+        # was taken; see RunData.generation
+        self.start = start
+        self.stop = stop
+        self.generation = generation
+
+
+    def __len__(self):
+        return self._length
+
+
+    def __getitem__(self, index):
+        '''
+        Get a sample as a (time, load, extension) tuple
+        '''
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("sample index out of range")
+        index += self._start
+        chunk = self._chunks[index // self._chunk_size]
+        offset = index % self._chunk_size
+        return (chunk[0][offset], chunk[1][offset], chunk[2][offset])
+
+
+    def chunks(self, start=0):
+        '''
+        Iterate over the stored samples in blocks
+
+        Parameters
+        --------
+        start : int
+            the index within the view of the first sample to include
+
+        Yields
+        --------
+        tuple - of time, load and extension sequences (memoryviews of
+            doubles) of equal length
+        '''
+        start = min(max(0, start), self._length)
+        remaining = self._length - start
+        start += self._start
+        first = start // self._chunk_size
+        offset = start % self._chunk_size
+        for chunk in self._chunks[first:]:
+            if 0 >= remaining:
+                break
+            count = min(remaining, self._chunk_size - offset)
+            yield tuple(memoryview(column)[offset:offset + count] for column in chunk)
+            remaining -= count
+            offset = 0
+
+
+    def column(self, name):
+        '''
+        Iterate over the values of a single column
+
+        Parameters
+        --------
+        name : str
+            one of column_names
+        '''
+        index = self.column_names.index(name)
+        for chunk in self.chunks():
+            yield from chunk[index]
+
+
+    def rows(self):
+        '''
+        Iterate over the samples as (time, load, extension) tuples
+        '''
+        for times, loads, extensions in self.chunks():
+            yield from zip(times, loads, extensions)
+
+
+class RunData:
+    '''
+    Columnar storage for the time, load and extension of each sample
+
+    RunData is not thread safe, callers sharing an instance between threads
+    must serialize access to append, clear, set_window and snapshot. A
+    snapshot can be used without holding any lock.
+    '''
+
+    chunk_size = 4096
+
+    # the size of a sample: three doubles
+    sample_size = 3 * array('d').itemsize
+
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+
+        # the time of the first sample of each chunk, kept apart from the
+        # chunks so finding the window doesn't touch every chunk
+        self._first_times = []
+
+        # the range of the load over all samples
+        self._load_min = float("inf")
+        self._load_max = float("-inf")
+
+        # generation is incremented whenever samples are removed or the
+        # window changes so consumers of snapshots know to start over
+        self.generation = 0
+
+        # when window is set the range of the load over samples taken in the
+        # last window seconds is tracked with a pair of monotonic queues of
+        # (time, load) which are rebuilt lazily after the window changes
+        self.window = None
+        self._window_minima = deque()
+        self._window_maxima = deque()
+        self._window_stale = False
+
+
+    def __len__(self):
+        return self._length
+
+
+    def _new_chunk(self):
+        # chunks are never resized so views may hold memoryviews of them
+        empty = bytes(self.sample_size // 3 * self.chunk_size)
+        return (array('d', empty), array('d', empty), array('d', empty))
+
+
+    def append(self, time, load, extension):
+        '''
+        Add a sample
+
+        Parameters
+        --------
+        time : float
+            the time, as from time.monotonic(), the sample was taken
+        load : float
+            the load in Newtons
+        extension : float
+            the extension
+        '''
+        offset = self._length % self.chunk_size
+        if 0 == offset:
+            self._chunks.append(self._new_chunk())
+            self._first_times.append(time)
+        times, loads, extensions = self._chunks[-1]
+        times[offset] = time
+        loads[offset] = load
+        extensions[offset] = extension
+        self._length += 1
+
+        if load < self._load_min:
+            self._load_min = load
+        if load > self._load_max:
+            self._load_max = load
+        if self.window is not None and not self._window_stale:
+            self._track_window(time, load)
+
+
+    def extend(self, run_data, start=0):
+        '''
+        Append the samples of a snapshot, possibly of another store
+
+        Parameters
+        --------
+        run_data : RunDataView
+            the samples to add
+        start : int
+            the index within the snapshot of the first sample to add
+        '''
+        append = self.append
+        for times, loads, extensions in run_data.chunks(start):
+            for time, load, extension in zip(times, loads, extensions):
+                append(time, load, extension)
+
+
+    def _track_window(self, time, load):
+        minima = self._window_minima
+        maxima = self._window_maxima
+        while minima and minima[-1][1] >= load:
+            minima.pop()
+        minima.append((time, load))
+        while maxima and maxima[-1][1] <= load:
+            maxima.pop()
+        maxima.append((time, load))
+
+        # forget samples which have left the window
+        oldest = time - self.window
+        while minima[0][0] < oldest:
+            minima.popleft()
+        while maxima[0][0] < oldest:
+            maxima.popleft()
+
+
+    def _window_start(self):
+        # index of the first sample in the window; times are monotonic
+        if self.window is None or 0 == self._length:
+            return 0
+        chunk = self._chunks[(self._length - 1) // self.chunk_size]
+        oldest = chunk[0][(self._length - 1) % self.chunk_size] - self.window
+        index = max(0, bisect_left(self._first_times, oldest) - 1)
+        times = self._chunks[index][0]
+        stop = min(self.chunk_size, self._length - index * self.chunk_size)
+        return index * self.chunk_size + bisect_left(times, oldest, 0, stop)
+
+
+    def set_window(self, window):
+        '''
+        Limit windowed snapshots to recent samples
+
+        Parameters
+        --------
+        window : float
+            the number of seconds before the most recent sample to include or
+            None to include the whole run
+        '''
+        self.window = window
+        self.generation += 1
+        self._window_minima.clear()
+        self._window_maxima.clear()
+        self._window_stale = window is not None
+
+
+    def clear(self):
+        '''
+        Remove all samples. Existing snapshots are unaffected.
+        '''
+        self._chunks = []
+        self._first_times = []
+        self._length = 0
+        self._load_min = float("inf")
+        self._load_max = float("-inf")
+        self.set_window(self.window)
+
+
+    def snapshot(self, windowed=False):
+        '''
+        Get an immutable view of the samples stored so far
+
+        Parameters
+        --------
+        windowed : bool
+            if True and a window has been set, only include samples taken in
+            the last window seconds
+
+        Returns
+        --------
+        RunDataView
+        '''
+        if not windowed or self.window is None:
+            return RunDataView(self._chunks[:], 0, self._length, self.chunk_size,
+                               self._load_min, self._load_max, self.generation)
+
+        start = self._window_start()
+        if self._window_stale:
+            self._window_stale = False
+            view = RunDataView(self._chunks, start, self._length, self.chunk_size,
+                               None, None, self.generation)
+            for time, load in zip(view.column("time"), view.column("load")):
+                self._track_window(time, load)
+
+        if not self._window_minima:
+            return RunDataView(self._chunks[:], start, self._length, self.chunk_size,
+                               None, None, self.generation)
+        return RunDataView(self._chunks[:], start, self._length, self.chunk_size,
+                           self._window_minima[0][1], self._window_maxima[0][1],
+                           self.generation)
+
+
+    def memory_usage(self):
+        '''
+        Get the number of bytes used to hold the samples
+        '''
+        usage = sys.getsizeof(self._chunks) + sys.getsizeof(self._first_times)
+        for chunk in self._chunks:
+            usage += sys.getsizeof(chunk) + sum(sys.getsizeof(column) for column in chunk)
+        return usage
+
+
+    def bytes_per_sample(self):
+        '''
+        Get the memory used per sample. Space is allocated a chunk at a time
+        so this approaches sample_size (24 bytes) as chunks fill and never
+        exceeds twice sample_size once the first chunk is full.
+        '''
+        if 0 == self._length:
+            return 0.0
+        return self.memory_usage() / self._length
+
+
+def default_mapping_directory():
+    '''
+    The directory MappedRunData keeps its files in by default; in the user's
+    cache directory as /tmp may be held in memory
+    '''
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "load_frame_controller")
+
+
+class MappedRunData(RunData):
+    '''
+    RunData which keeps samples in a memory mapped file rather than memory
+
+    The file grows a segment, holding one chunk, at a time. Each segment is
+    mapped separately so a snapshot remains valid however much the file
+    grows afterwards. The file is unnamed and is removed by the operating
+    system once neither the store nor any snapshot uses it, so clearing
+    starts a new file.
+    '''
+
+    # larger chunks mean fewer mappings; 1.5 MiB per segment
+    chunk_size = 65536
+
+
+    def __init__(self, directory=None):
+        '''
+        Parameters
+        --------
+        directory : str
+            where to create the file; see default_mapping_directory()
+
+        Raises
+        --------
+        OSError - if the file can not be created
+        '''
+        super().__init__()
+        self.directory = directory or default_mapping_directory()
+        self._open()
+
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = tempfile.TemporaryFile(prefix="run-", dir=self.directory)
+        self._file_size = 0
+
+
+    def _new_chunk(self):
+        column_size = self.sample_size // 3 * self.chunk_size
+        offset = self._file_size
+        self._file_size += 3 * column_size
+        os.ftruncate(self._file.fileno(), self._file_size)
+        segment = memoryview(mmap.mmap(self._file.fileno(), 3 * column_size,
+                                       offset=offset)).cast('d')
+        return (segment[:self.chunk_size],
+                segment[self.chunk_size:2 * self.chunk_size],
+                segment[2 * self.chunk_size:])
+
+
+    def clear(self):
+        '''
+        Remove all samples. Existing snapshots are unaffected.
+
+        Raises
+        --------
+        OSError - if a new file can not be created
+        '''
+        # the old file lives on while snapshots map it
+        self._open()
+        super().clear()
+
+
+    def file_size(self):
+        '''
+        Get the size in bytes of the file holding the samples; memory_usage()
+        counts only the memory used to track them
+        '''
+        return self._file_size
+
+
+    def bytes_per_sample(self):
+        '''
+        Get the storage used per sample, counting the file holding the
+        samples as well as the memory used to track them
+        '''
+        if 0 == self._length:
+            return 0.0
+        return (self.memory_usage() + self._file_size) / self._length
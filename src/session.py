@@ -0,0 +1,365 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from threading import Barrier, Lock, Thread
+from time import monotonic
+
+# Import from our module
+from .acquisition import Acquisition
+from .rundata import RunData
+
+'''
+Acquire data from several load frames at once
+
+A session connects to any number of load frames. Each is polled by its own
+acquisition thread into its own store so a slow frame never holds up the
+others; the serial links are independent and the drivers spend their time
+waiting on I/O with the GIL released. Motion can be started and stopped on
+every frame together and the runs combined on a common time base.
+
+Nothing in this module depends on Gtk.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class FrameSession:
+    '''
+    One load frame in a session along with its acquisition and run data
+    '''
+
+    def __init__(self, name, machine, polling_interval=1, free_run=False):
+        '''
+        Parameters
+        --------
+        name : str
+            identifies the frame within the session e.g. its port name
+        machine : loadframe.LoadFrame
+            the connected load frame
+        polling_interval : float
+            seconds between polls
+        free_run : bool
+            poll as fast as the serial link allows
+        '''
+        self.name = name
+        self.machine = machine
+        self.range = machine.get_load_cell_range()
+        self.run_data = RunData()
+        self.run_data_lock = Lock()
+        self.collecting = False
+        self.acquisition = Acquisition(machine, self._sample_acquired, self.range,
+                                       polling_interval)
+        self.acquisition.set_free_run(free_run)
+
+
+    def _sample_acquired(self, now, load, extension):
+        if self.collecting:
+            with self.run_data_lock:
+                self.run_data.append(now, load, extension)
+
+
+    def snapshot(self):
+        '''
+        Get an immutable view of the samples collected so far
+        '''
+        with self.run_data_lock:
+            return self.run_data.snapshot()
+
+
+    def clear(self):
+        with self.run_data_lock:
+            self.run_data.clear()
+
+
+class Session:
+    '''
+    A set of load frames acquired from, and moved, together
+    '''
+
+    def __init__(self, polling_interval=1, free_run=False):
+        self.polling_interval = polling_interval
+        self.free_run = free_run
+        self.frames = {}
+        self.start_time = None
+
+
+    def __len__(self):
+        return len(self.frames)
+
+
+    def add_frame(self, name, machine):
+        '''
+        Add a connected load frame to the session and start polling it
+
+        Returns
+        --------
+        FrameSession
+        '''
+        if name in self.frames:
+            raise KeyError("{} is already part of the session".format(name))
+        frame = FrameSession(name, machine, self.polling_interval, self.free_run)
+        self.frames[name] = frame
+        frame.acquisition.start()
+        return frame
+
+
+    def remove_frame(self, name):
+        '''
+        Stop polling a load frame and remove it from the session
+
+        Returns
+        --------
+        FrameSession - the removed frame, which keeps its run data
+        '''
+        frame = self.frames.pop(name)
+        frame.collecting = False
+        frame.acquisition.stop()
+        return frame
+
+
+    def close(self):
+        '''
+        Stop every frame and stop polling
+        '''
+        try:
+            self.stop()
+        finally:
+            # even if a frame couldn't be stopped, e.g. its link has gone
+            for name in list(self.frames):
+                self.remove_frame(name)
+
+
+    def set_polling_interval(self, interval):
+        self.polling_interval = interval
+        for frame in self.frames.values():
+            frame.acquisition.set_polling_interval(interval)
+
+
+    def set_free_run(self, free_run):
+        self.free_run = free_run
+        for frame in self.frames.values():
+            frame.acquisition.set_free_run(free_run)
+
+
+    def _on_every_frame(self, action):
+        '''
+        Call action(frame) for every frame at, as near as possible, the same
+        instant; each call is made from its own thread released by a barrier
+        so one slow serial link doesn't delay the others
+
+        Returns
+        --------
+        dict - mapping frame names to the time, as from time.monotonic(),
+            each action completed
+
+        Raises
+        --------
+        the first exception raised by any action, after all have run
+        '''
+        frames = list(self.frames.values())
+        barrier = Barrier(len(frames) + 1)
+        completed = {}
+        errors = []
+
+        def run(frame):
+            barrier.wait()
+            try:
+                action(frame)
+                completed[frame.name] = monotonic()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=run, args=(frame,), daemon=True) for frame in frames]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return completed
+
+
+    def start(self, direction=1, run_rate=None):
+        '''
+        Start collecting data and start every frame moving together
+
+        Parameters
+        --------
+        direction : int
+            1 to move up, -1 to move down, 0 to collect without moving
+        run_rate : float
+            if given, set on every frame before starting
+
+        Returns
+        --------
+        float - the spread in seconds between the first and last frame
+            acknowledging the start
+        '''
+        if not self.frames:
+            return 0.0
+        if run_rate is not None:
+            self._on_every_frame(lambda frame: frame.machine.set_run_rate(run_rate))
+
+        self.start_time = monotonic()
+        for frame in self.frames.values():
+            frame.collecting = True
+
+        if 1 == direction:
+            completed = self._on_every_frame(lambda frame: frame.machine.start_moving_up())
+        elif -1 == direction:
+            completed = self._on_every_frame(lambda frame: frame.machine.start_moving_down())
+        else:
+            return 0.0
+        return max(completed.values()) - min(completed.values())
+
+
+    def stop(self):
+        '''
+        Stop every frame moving together then stop collecting data
+
+        Returns
+        --------
+        float - the spread in seconds between the first and last frame
+            acknowledging the stop
+        '''
+        if not self.frames:
+            return 0.0
+        try:
+            completed = self._on_every_frame(lambda frame: frame.machine.stop_moving())
+        finally:
+            for frame in self.frames.values():
+                frame.collecting = False
+        return max(completed.values()) - min(completed.values())
+
+
+    def clear(self):
+        for frame in self.frames.values():
+            frame.clear()
+
+
+    def combined(self):
+        '''
+        Get a time aligned view of every frame's run data
+
+        Returns
+        --------
+        CombinedView
+        '''
+        return CombinedView({name: frame.snapshot() for name, frame in self.frames.items()},
+                            self.start_time)
+
+
+class CombinedView:
+    '''
+    Snapshots of the run data of several frames on a common time base
+
+    Every frame is sampled by the same clock, time.monotonic(), but at its
+    own instants. Rows are produced at regular intervals with each frame's
+    load and extension linearly interpolated to the row's time. The
+    snapshots are walked in step so no copy of the data is made.
+    '''
+
+    def __init__(self, snapshots, start_time=None):
+        '''
+        Parameters
+        --------
+        snapshots : dict
+            mapping frame names to rundata.RunDataView instances
+        start_time : float
+            the time rows are measured from, defaults to the earliest sample
+        '''
+        self.names = sorted(snapshots)
+        self.snapshots = snapshots
+        if start_time is None:
+            firsts = [view[0][0] for view in snapshots.values() if 0 < len(view)]
+            start_time = min(firsts) if firsts else 0.0
+        self.start_time = start_time
+
+
+    def time_range(self):
+        '''
+        Get the first and last times covered by every frame
+
+        Returns
+        --------
+        tuple - of times, as from time.monotonic(), or None if any frame
+            has no samples
+        '''
+        views = [self.snapshots[name] for name in self.names]
+        if not views or any(0 == len(view) for view in views):
+            return None
+        first = max(view[0][0] for view in views)
+        last = min(view[-1][0] for view in views)
+        if last < first:
+            return None
+        return first, last
+
+
+    def header(self):
+        titles = ["Time"]
+        for name in self.names:
+            titles.append("{} Load (N)".format(name))
+            titles.append("{} Extension (mm)".format(name))
+        return titles
+
+
+    def rows(self, interval):
+        '''
+        Iterate over the period covered by every frame
+
+        Parameters
+        --------
+        interval : float
+            seconds between rows
+
+        Yields
+        --------
+        list - the time since start_time followed by the load and extension
+            of each frame, in the order of names
+        '''
+        covered = self.time_range()
+        if covered is None:
+            return
+        first, last = covered
+        cursors = [_Cursor(self.snapshots[name]) for name in self.names]
+        for step in range(int((last - first) / interval) + 1):
+            time = first + step * interval
+            row = [time - self.start_time]
+            for cursor in cursors:
+                row.extend(cursor.at(time))
+            yield row
+
+
+class _Cursor:
+    # walks a snapshot forwards interpolating between adjacent samples
+
+    def __init__(self, view):
+        self._samples = view.rows()
+        self._before = next(self._samples)
+        self._after = next(self._samples, None)
+
+
+    def at(self, time):
+        while self._after is not None and self._after[0] <= time:
+            self._before = self._after
+            self._after = next(self._samples, None)
+        before, after = self._before, self._after
+        if after is None or time <= before[0]:
+            return before[1], before[2]
+        fraction = (time - before[0]) / (after[0] - before[0])
+        return (before[1] + (after[1] - before[1]) * fraction,
+                before[2] + (after[2] - before[2]) * fraction)
@@ -0,0 +1,145 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from OS provided libraries e.g. python-gobject
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib, Gtk
+
+# Import from our module
+from .instrumentation import registry
+
+'''
+A window showing the statistics in the instrumentation registry
+
+The window refreshes itself every second while open. Collecting statistics
+can be switched on and off from it and a snapshot saved as JSON.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+def _format_histogram(histogram):
+    # durations are recorded in seconds but are easier to read in ms
+    if not histogram.get("count"):
+        return "none recorded"
+    # percentiles are the upper bound of their bucket, which may exceed max
+    maximum = histogram["max"]
+    return "{} recorded, mean {:.3f} ms, p50 ≤ {:.3f} ms, p99 ≤ {:.3f} ms, max {:.3f} ms".format(
+        histogram["count"], 1000 * histogram["mean"], 1000 * min(histogram["p50"], maximum),
+        1000 * min(histogram["p99"], maximum), 1000 * maximum)
+
+
+def _flatten(name, value):
+    # yield (name, text) for every scalar in nested dictionaries
+    if isinstance(value, dict):
+        if "bounds" in value and "counts" in value:
+            yield name, _format_histogram(value)
+            return
+        for key, item in value.items():
+            yield from _flatten("{}.{}".format(name, key) if name else key, item)
+    elif isinstance(value, float):
+        yield name, "{:.6g}".format(value)
+    elif not isinstance(value, (list, tuple)):
+        yield name, str(value)
+
+
+def rows(snapshot):
+    '''
+    Get the (name, text) pairs shown for a registry snapshot
+    '''
+    result = [(name, str(value)) for name, value in snapshot["counters"].items()]
+    result.extend((name, _format_histogram(histogram))
+                  for name, histogram in snapshot["histograms"].items())
+    result.extend(_flatten("", snapshot["sources"]))
+    return result
+
+
+class StatisticsWindow:
+    '''
+    Show counters and histograms from the acquisition path as they change
+
+    The layout is in ui/statistics.glade.
+    '''
+
+    # seconds between refreshes
+    refresh_interval = 1
+
+
+    def __init__(self, parent, use_bundled_resources=True):
+        '''
+        Parameters
+        --------
+        parent : Gtk.Window
+            the window the statistics window is kept above
+        use_bundled_resources : bool
+            load the layout from the resource bundle rather than ui/ in the
+            working directory; see Application
+        '''
+        if use_bundled_resources:
+            builder = Gtk.Builder.new_from_resource("/tech/tomegan/load_frame_controller/ui/statistics.glade")
+        else:
+            builder = Gtk.Builder.new_from_file("ui/statistics.glade")
+        self.window = builder.get_object("statistics_window")
+        self.window.set_transient_for(parent)
+        self.store = builder.get_object("statistics_list_store")
+        builder.get_object("collect_statistics_switch").set_active(registry.enabled)
+
+        # Connect signals (UIActions)
+        builder.connect_signals(self)
+
+        self.__refresh()
+        self.__timer = GLib.timeout_add_seconds(self.refresh_interval, self.__refresh)
+
+
+    def __refresh(self):
+        self.store.clear()
+        for name, text in rows(registry.snapshot()):
+            self.store.append([name, text])
+        return True
+
+
+    def ui_statistics_window_destroyed(self, _window):
+        GLib.source_remove(self.__timer)
+
+
+    def ui_collect_statistics_state_changed(self, _switch, state):
+        registry.enabled = state
+        return False  # let the switch show the new state
+
+
+    def ui_reset_statistics(self, _button):
+        registry.reset()
+        self.__refresh()
+
+
+    def ui_save_statistics(self, _button):
+        dialog = Gtk.FileChooserDialog(title = "Save Statistics",
+                                        parent = self.window,
+                                        action = Gtk.FileChooserAction.SAVE)
+        dialog.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        dialog.add_button(Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        dialog.set_current_name("statistics.json")
+        if dialog.run() == Gtk.ResponseType.OK:
+            try:
+                registry.dump(dialog.get_filename())
+            except IOError as e:
+                print(e)
+                error = Gtk.MessageDialog(transient_for=self.window, modal=True,
+                    message_type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE,
+                    text="Unable to save statistics: {}".format(e))
+                error.run()
+                error.destroy()
+        dialog.destroy()
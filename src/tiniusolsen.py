@@ -12,14 +12,19 @@
 from __future__ import division
 
 # Import from Python Standard Library
-from threading import RLock
-from time import sleep
+from abc import abstractmethod
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread
+from time import monotonic, sleep
 
 # Import from third party libraries
 from serial import Serial
 
 # Import from our module
-from .loadframe import LoadFrame
+from .instrumentation import registry
+from .loadframe import ConnectionLost, LoadFrame, Sample
+from .transport import CommandChannel, ReplyTimeout, SerialTransport
 
 '''
 Classes for communicating with Tinius Olsen load frames
@@ -42,30 +47,316 @@ class TiniusOlsenLoadFrame(LoadFrame):
     '''
     An abstract base class that implements some core functionality shared
     by all supported Tinius Olsen load frames 
+
+    Concrete subclasses declare the commands used to read load and extension
+    along with methods to decode the replies to those commands.
+
+    All I/O goes through a CommandChannel so the driver may be used from
+    several threads; commands which start, stop or change the speed of the
+    crosshead go ahead of any queued reads. Commands whose replies are lost
+    or can't be decoded are sent again up to retry_limit times before
+    ConnectionLost is raised.
     '''
 
+    load_command = None
+    extension_command = None
+
+    # serial settings and the longest expected reply, including terminators,
+    # to the load and extension commands. Used to estimate how fast the
+    # serial link can deliver samples
+    baud_rate = None
+    bits_per_byte = 10  # 8N1 framing: start bit, 8 data bits and stop bit
+    sample_reply_length = None
+
+    # how many times to resend a command whose reply is lost or garbled
+    retry_limit = 3
+
+    # seconds close waits for the channel's thread
+    close_timeout = 1.0
+
+
+    @property
+    def byte_time(self):
+        '''
+        Seconds taken to transmit one byte over the serial link
+        '''
+        return self.bits_per_byte / self.baud_rate
+
+
     def __init__(self):
         self.communication_port = None  # insures that the attribute exists...
-        self._lock = RLock()
+        self.communication_port_name = None
+        self.transport = None
+        self.channel = None
+        self.retries = 0
+        self.corrupt_replies = 0
+        self.reconnects = 0
 
 
     def __del__(self):
-        if self.communication_port:
-            self.stop_moving()
-            self.communication_port.close()
+        try:
+            self.close()
+        except (IOError, OSError):
+            pass  # e.g. the controller has already gone
 
 
-    def _read(self):
-        buffer = bytearray()
-        with self._lock:
-            while True:
-                b = self.communication_port.read()
-                if 1 > len(b) or 13 == b[0] or 0 == b[0]:
-                    break
+    def close(self):
+        '''
+        Stop the load frame if it is moving and close the serial port
+
+        Never waits longer than close_timeout for the channel's thread, which
+        may already have been stopped e.g. when called from __del__ as the
+        interpreter exits.
+        '''
+        if self.communication_port:
+            try:
+                if self.channel and self.channel.running():
+                    self._exchange((b'WS',), CommandChannel.URGENT, timeout=self.close_timeout)
                 else:
-                    buffer.append(b[0])
+                    # nothing will read the reply; just make sure it stops
+                    self.communication_port.write(b'WS\r')
+            except FutureTimeoutError:
+                pass  # the stop has been written, its reply is not needed
+            finally:
+                self._disconnect()
+
+
+    def _disconnect(self):
+        if self.channel:
+            self.channel.close(self.close_timeout)
+        if self.communication_port:
+            try:
+                self.communication_port.close()
+            except (IOError, OSError):
+                pass  # e.g. the adapter has been unplugged
+            self.communication_port = None
+
+
+    def _open(self, communication_port_name):
+        '''
+        Open the serial port and wrap it in a transport
+
+        Raises
+        --------
+        IOError - if the serial port can not be opened
+        '''
+        self.communication_port_name = communication_port_name
+        # exclusive so autodetect, or a second instance, can't write into
+        # the link while it is in use
+        self.communication_port = Serial(communication_port_name, self.baud_rate, timeout=1,
+                                         exclusive=True)
+        self.transport = SerialTransport(self.communication_port, self.byte_time)
+        self._minimum_excess = None
+        self.channel = CommandChannel(self.transport)
+
+
+    def reconnect(self):
+        '''
+        Reopen the serial port after ConnectionLost e.g. once a cable has
+        been plugged back in; the load frame is not stopped
+
+        Raises
+        --------
+        IOError - if the serial port can not be opened
+        LookupError - if the controller doesn't report its load cell
+        '''
+        self._disconnect()
+        self._open(self.communication_port_name)
+        self.get_load_cell_range()
+        self.reconnects += 1
+
+
+    def _exchange(self, commands, priority=CommandChannel.NORMAL, decode=None, timeout=None):
+        '''
+        Send a batch of commands, resending it if a reply is lost or can't
+        be decoded
+
+        Parameters
+        --------
+        commands : tuple
+            of bytes, the commands including any arguments
+        priority : int
+            see CommandChannel
+        decode : callable
+            passed the list of replies; raises ValueError if they are garbled
+        timeout : float
+            seconds to wait for the channel's thread on each attempt, see
+            CommandChannel.call
+
+        Returns
+        --------
+        tuple - the transport.Exchange and the replies passed through decode
+
+        Raises
+        --------
+        ConnectionLost - if no usable reply is received after retry_limit
+            retries or the serial port fails
+        concurrent.futures.TimeoutError - if the timeout passes
+        '''
+        error = None
+        for attempt in range(1 + self.retry_limit):
+            if attempt:
+                self.retries += 1
+            try:
+                exchange = self.channel.call(*commands, priority=priority, timeout=timeout)
+                return exchange, decode(exchange.replies) if decode else exchange.replies
+            except ReplyTimeout as e:
+                error = e
+            except FutureTimeoutError:
+                raise  # the thread isn't answering; resending won't help
+            except ValueError as e:
+                self.corrupt_replies += 1
+                self.channel.resync()
+                error = e
+            except IOError as e:
+                # the port has failed or been closed; retrying won't help
+                error = e
+                break
+        raise ConnectionLost("No usable reply from the load frame on {}: {}".format(
+            self.communication_port_name, error)) from error
+
+
+    def _command(self, command, priority=CommandChannel.NORMAL):
+        '''
+        Send a command and get the reply
+
+        Parameters
+        --------
+        command : bytes
+            the command including any argument e.g. b'WV12.5'
+        priority : int
+            CommandChannel.URGENT for commands which move the crosshead
+
+        Returns
+        --------
+        bytes - the reply without its terminator
+        '''
+        return self._exchange((command,), priority)[1][0]
+
+
+    def link_statistics(self):
+        '''
+        Get counters describing the health of the serial link
+
+        Returns
+        --------
+        dict - of timeouts, resyncs, retries, corrupt_replies, reconnects
+            and the current round trip estimate
+        '''
+        statistics = self.channel.statistics()
+        statistics.update(retries=self.retries, corrupt_replies=self.corrupt_replies,
+                          reconnects=self.reconnects)
+        return statistics
+
+
+    def stop_latency(self, percentile=99):
+        '''
+        Get a percentile of the time, in seconds, recent motion commands
+        took to be acknowledged or None if none have been sent; stop is
+        measured along with start and set_run_rate which are sent the same way
+        '''
+        return self.channel.stop_latency(percentile)
+
+
+    @abstractmethod
+    def _decode_extension(self, reply):
+        '''
+        Convert a reply to extension_command to Millimeters (mm)
+
+        Raises
+        --------
+        ValueError - if the reply is garbled
+        '''
+        pass
+
+
+    @abstractmethod
+    def _decode_load(self, reply):
+        '''
+        Convert a reply to load_command to Newtons (N)
+
+        Raises
+        --------
+        ValueError - if the reply is garbled
+        '''
+        pass
 
-            return buffer
+
+    def read_extension(self):
+        with registry.timer("driver.read_extension"):
+            return self._exchange((self.extension_command,),
+                                  decode=lambda replies: self._decode_extension(replies[0]))[1]
+
+
+    def read_load(self):
+        with registry.timer("driver.read_load"):
+            return self._exchange((self.load_command,),
+                                  decode=lambda replies: self._decode_load(replies[0]))[1]
+
+
+    def read_sample(self):
+        '''
+        Get the current load and extension
+
+        Both read commands are sent in one write before either reply is read
+        so the pair costs a single round trip to the controller. Each reading
+        is timestamped from when its reply arrived, less the time taken to
+        transmit the reply and an estimate of the latency of the reply path;
+        see _measured_at.
+
+        Returns
+        --------
+        Sample - a namedtuple of time, load and extension in the units of
+            read_load and read_extension along with when each was measured
+        '''
+        with registry.timer("driver.read_sample"):
+            exchange, (load, extension) = self._exchange(
+                (self.load_command, self.extension_command), CommandChannel.POLL,
+                lambda replies: (self._decode_load(replies[0]), self._decode_extension(replies[1])))
+
+        # the round trip not explained by transmission is time spent in the
+        # controller and serial adapters; the least seen is the fixed part
+        wire_bytes = (sum(len(command) + 1 for command in (self.load_command, self.extension_command))
+                      + sum(len(reply) + 1 for reply in exchange.replies))
+        excess = exchange.received - exchange.sent - wire_bytes * self.byte_time
+        if self._minimum_excess is None or excess < self._minimum_excess:
+            self._minimum_excess = max(0.0, excess)
+
+        load_time = self._measured_at(exchange.reply_times[0], exchange.replies[0])
+        extension_time = self._measured_at(exchange.reply_times[1], exchange.replies[1])
+        return Sample(load_time, load, extension, load_time, extension_time)
+
+
+    def _measured_at(self, reply_time, reply):
+        '''
+        Estimate when the controller took the reading it replied with from
+        when the reply's terminator arrived; the fixed latency is assumed to
+        be split evenly between the command and reply paths
+        '''
+        return reply_time - (len(reply) + 1) * self.byte_time - self._minimum_excess / 2
+
+
+    def maximum_sample_rate(self):
+        '''
+        Estimate the highest rate, in samples per second, at which
+        read_sample could be called given the time needed to transmit the
+        commands and replies over the serial link
+
+        Replies are as long as the digits of the value read, so the average
+        length of the load and extension replies received so far is used,
+        or the longest possible, sample_reply_length, before any have been.
+        Processing time in the controller and in this process is ignored.
+        This is an estimate, not a limit: rates somewhat above it may be
+        achieved while readings are short and below it while they are long.
+        '''
+        reply_length = self.sample_reply_length
+        statistics = self.transport.statistics() if self.transport else {}
+        seen = [statistics.get(command.decode('ascii'))
+                for command in (self.load_command, self.extension_command)]
+        if all(counters and counters["count"] for counters in seen):
+            reply_length = sum(counters["bytes_read"] / counters["count"] for counters in seen)
+        sample_length = len(self.load_command) + len(self.extension_command) + 2 + reply_length
+        return self.baud_rate / (self.bits_per_byte * sample_length)
 
 
 class TiniusOlsenH5KSeries(TiniusOlsenLoadFrame):
@@ -101,6 +392,12 @@ class TiniusOlsenH5KSeries(TiniusOlsenLoadFrame):
         "83": 250000
     }
 
+    load_command = b'RL'
+    extension_command = b'RP'
+
+    baud_rate = 19200
+    sample_reply_length = 15  # e.g. "-30000\r" and "1000000\r"
+
 
     def __init__(self, communication_port_name):
         '''
@@ -113,10 +410,16 @@ class TiniusOlsenH5KSeries(TiniusOlsenLoadFrame):
         Raises
         --------
         IOError - if the serial port can not be opened
+        LookupError - if the load cell type isn't known
         '''
         super().__init__()
-        self.communication_port = Serial(communication_port_name, 19200, timeout=1)
-        self.range = self.get_load_cell_range()
+        self._open(communication_port_name)
+        try:
+            self.range = self.get_load_cell_range()
+        except BaseException:
+            # the caller gets no instance to close
+            self._disconnect()
+            raise
 
 
     def get_load_cell_range(self):
@@ -135,25 +438,29 @@ class TiniusOlsenH5KSeries(TiniusOlsenLoadFrame):
             raise LookupError("Machine reports unknown load cell is in use") from ke
 
 
+    def _decode_extension(self, reply):
+        return 0.001 * int(reply)
+
+
+    def _decode_load(self, reply):
+        # 0X7FFF seems like a logical conversion constant but
+        # the machines do not seem to have binary number ranges
+        # d30000 works better
+        return int(reply) / 30000
+
+
     def read_extension(self):
         '''
         Get the current extension in millimeters (mm)
         '''
-        with self._lock:
-            self.communication_port.write(b'RP\r')
-            return 0.001 * int(self._read())
+        return super().read_extension()
 
 
     def read_load(self):
         '''
         Get the current load in Newtons (N)
         '''
-        with self._lock:
-            self.communication_port.write(b'RL\r')
-            # 0X7FFF seems like a logical conversion constant but
-            # the machines do not seem to have binary number ranges
-            # d30000 works better
-            return int(self._read()) / 30000
+        return super().read_load()
 
 
     def read_load_cell_type(self):
@@ -164,47 +471,32 @@ class TiniusOlsenH5KSeries(TiniusOlsenLoadFrame):
         --------
         str - which should be one of the predefined keys in range_lookup_table 
         '''
-        with self._lock:
-            self.communication_port.write(b'RC\r')
-            return self._read().decode('utf-8')
+        return self._command(b'RC').decode('utf-8')
 
 
     def set_run_rate(self, rate):
-        with self._lock:
-            self.communication_port.write(b'WV')
-            self.communication_port.write(bytes("{:.1f}".format(rate), 'utf-8'))
-            self.communication_port.write(b'\r')
-            self._read() # purge the \r
+        self._command(b'WV' + bytes("{:.1f}".format(rate), 'utf-8'),
+                      CommandChannel.URGENT) # reply is an empty line
 
 
     def start_moving_up(self):
-        with self._lock:
-            self.communication_port.write(b'WF\r')
-            self._read() # purge the \r
+        self._command(b'WF', CommandChannel.URGENT) # reply is an empty line
 
 
     def start_moving_down(self):
-        with self._lock:
-            self.communication_port.write(b'WR\r')
-            self._read() # purge the \r
+        self._command(b'WR', CommandChannel.URGENT) # reply is an empty line
 
 
     def stop_moving(self):
-        with self._lock:
-            self.communication_port.write(b'WS\r')
-            self._read() # purge the \r
+        self._command(b'WS', CommandChannel.URGENT) # reply is an empty line
 
 
     def zero_extension(self):
-        with self._lock:
-            self.communication_port.write(b'WP\r')
-            self._read() # purge the \r
+        self._command(b'WP') # reply is an empty line
 
 
     def zero_load(self):
-        with self._lock:
-            self.communication_port.write(b'WZ\r')
-            self._read() # purge the \r
+        self._command(b'WZ') # reply is an empty line
 
 
 class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
@@ -215,6 +507,11 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
     These machines assume that software will manipulate data to provide
     zeroing in software always reporting an absolute value over the serial
     protocol 
+
+    After a zero command the controller takes a while to settle. Rather than
+    waiting a fixed time, the reading is sampled until it has stayed within
+    settle_tolerance counts for settle_window seconds and the offset is taken
+    from those readings.
     '''
 
     range_lookup_table = {
@@ -225,6 +522,20 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
         "6": 10000
     }
 
+    load_command = b'R1'
+    extension_command = b'R2'
+
+    baud_rate = 9600
+    sample_reply_length = 13  # e.g. "4048\r" and "1000000\r"
+
+    # seconds between readings while waiting for the controller to settle
+    # after zeroing, how long and how closely, in counts, readings must
+    # agree to be settled and how long to wait before giving up
+    settle_poll_interval = 0.1
+    settle_window = 1.0
+    settle_tolerance = 2
+    settle_timeout = 30.0
+
 
     def __init__(self, communication_port_name):
         '''
@@ -239,7 +550,7 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
         IOError - if the serial port can not be opened
         '''
         super().__init__()
-        self.communication_port = Serial(communication_port_name, 9600, timeout=1)
+        self._open(communication_port_name)
         self.zero_load_offset = 0
         self.zero_extension_offset = 0
 
@@ -260,13 +571,19 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
             raise LookupError("Machine reports unknown load cell is in use") from ke
 
 
+    def _decode_extension(self, reply):
+        return int(reply) - self.zero_extension_offset
+
+
+    def _decode_load(self, reply):
+        return (int(reply) - self.zero_load_offset) / 2000
+
+
     def read_extension(self):
         '''
         Get the current extension as a multiple of 0.001mm e.g. 6859 is 6.859mm
         '''
-        with self._lock:
-            self.communication_port.write(b'R2\r')
-            return int(self._read()) - self.zero_extension_offset
+        return super().read_extension()
 
 
     def read_load(self):
@@ -276,9 +593,7 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
         To get the load in Netwons multiply the value returned by this method
         by the value returned from get_load_cell_range
         '''
-        with self._lock:
-            self.communication_port.write(b'R1\r')
-            return (int(self._read()) - self.zero_load_offset) / 2000
+        return super().read_load()
 
 
     def read_load_cell_type(self):
@@ -289,50 +604,144 @@ class TiniusOlsen1000Series(TiniusOlsenLoadFrame):
         --------
         str - which should be one of the predefined keys in range_lookup_table 
         '''
-        with self._lock:
-            self.communication_port.write(b'RC\r')
-            return self._read().decode('utf-8')
+        return self._command(b'RC').decode('utf-8')
 
 
     def set_run_rate(self, rate):
-        with self._lock:
-            self.communication_port.write(b'WV')
-            self.communication_port.write(bytes("{:.1f}".format(rate), 'utf-8'))
-            self.communication_port.write(b'\r')
-            self._read() # purge the \r
+        self._command(b'WV' + bytes("{:.1f}".format(rate), 'utf-8'),
+                      CommandChannel.URGENT) # reply is an empty line
 
 
     def start_moving_up(self):
-        with self._lock:
-            self.communication_port.write(b'WF\r')
-            self._read() # purge the \r
+        self._command(b'WF', CommandChannel.URGENT) # reply is an empty line
 
 
     def start_moving_down(self):
-        with self._lock:
-            self.communication_port.write(b'WR\r')
-            self._read() # purge the \r
+        self._command(b'WR', CommandChannel.URGENT) # reply is an empty line
 
 
     def stop_moving(self):
-        with self._lock:
-            self.communication_port.write(b'WS\r')
-            self._read() # purge the \r
+        self._command(b'WS', CommandChannel.URGENT) # reply is an empty line
 
 
     def zero_extension(self):
-        with self._lock:
-            self.communication_port.write(b'WE\r')
-            self._read() # purge the \r
-            sleep(15)
-            self.communication_port.write(b'R2\r')
-            self.zero_extension_offset = int(self._read())
+        '''
+        Zero the extension, blocking until the controller has settled
+
+        Raises
+        --------
+        TimeoutError - if the extension doesn't settle
+        '''
+        self.zero_extension_async().result()
 
 
     def zero_load(self):
-        with self._lock:
-            self.communication_port.write(b'WZ\r')
-            self._read() # purge the \r
-            sleep(15)
-            self.communication_port.write(b'R1\r')
-            self.zero_load_offset = int(self._read())
+        '''
+        Zero the load, blocking until the controller has settled
+
+        Raises
+        --------
+        TimeoutError - if the load doesn't settle
+        '''
+        self.zero_load_async().result()
+
+
+    def zero_extension_async(self):
+        '''
+        Zero the extension in a background thread; readings continue to be
+        relative to the previous zero until the controller has settled
+        '''
+        return self._zero_async(b'WE', self.extension_command, "zero_extension_offset")
+
+
+    def zero_load_async(self):
+        '''
+        Zero the load in a background thread; readings continue to be
+        relative to the previous zero until the controller has settled
+        '''
+        return self._zero_async(b'WZ', self.load_command, "zero_load_offset")
+
+
+    def _zero_async(self, zero_command, read_command, offset_name):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        Thread(target=self._settle, daemon=True,
+               args=(future, zero_command, read_command, offset_name)).start()
+        return future
+
+
+    def _settle(self, future, zero_command, read_command, offset_name):
+        '''
+        Send a zero command then read until the readings settle and store
+        their average as the offset
+
+        Intended to be run as a thread. Each command is queued with the
+        polls so sampling continues meanwhile.
+        '''
+        try:
+            self._command(zero_command) # reply is an empty line
+            detector = SettleDetector(self.settle_window, self.settle_tolerance,
+                                      self.settle_timeout)
+            offset = None
+            while offset is None:
+                sleep(self.settle_poll_interval)
+                offset = detector.add(monotonic(), self._command(read_command))
+            setattr(self, offset_name, offset)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+
+
+class SettleDetector:
+    '''
+    Decide, from a stream of raw readings, when a controller has settled
+    after being zeroed
+
+    Readings have settled once they have stayed within tolerance counts of
+    each other for window seconds.
+    '''
+
+    def __init__(self, window, tolerance, timeout):
+        self.window = window
+        self.tolerance = tolerance
+        self.started = monotonic()
+        self.deadline = self.started + timeout
+        self._readings = deque()  # (time, counts) over the last window
+
+
+    def add(self, now, reply):
+        '''
+        Consider another reading
+
+        Parameters
+        --------
+        now : float
+            the time, as from time.monotonic(), of the reading
+        reply : bytes
+            the controller's reply to the read command
+
+        Returns
+        --------
+        int - the average of the settled readings, or None if not yet settled
+
+        Raises
+        --------
+        TimeoutError - if the readings haven't settled by the deadline
+        '''
+        readings = self._readings
+        try:
+            readings.append((now, int(reply)))
+        except ValueError:
+            # a garbled reply; carry on with the next reading
+            pass
+        while readings and readings[0][0] < now - self.window:
+            readings.popleft()
+
+        counts = [reading for _time, reading in readings]
+        if (now - self.started >= self.window and 2 < len(counts)
+                and max(counts) - min(counts) <= self.tolerance):
+            return int(round(sum(counts) / len(counts)))
+        if now > self.deadline:
+            raise TimeoutError("Readings did not settle within {:g} seconds of zeroing".format(
+                self.deadline - self.started))
+        return None
@@ -0,0 +1,859 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import asyncio
+from collections import deque, namedtuple
+from concurrent.futures import Future
+import heapq
+from itertools import count
+import os
+import re
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+
+'''
+Frame oriented transport for the text over serial protocols spoken by
+supported load frames
+
+Replies from the supported controllers are ASCII strings terminated by a
+carriage return (or occasionally a NUL). Rather than reading a reply one byte
+at a time, the transport reads whatever the serial port has buffered and
+splits it into frames with an incremental parser which keeps any leftover
+bytes for the next reply.
+
+CommandChannel makes one thread the sole reader of a serial port so commands
+from several threads can be queued by priority; commands which move or stop
+the load frame don't wait behind a slow poll. The channel waits for each
+reply only as long as recent round trips suggest it should, much as TCP does,
+and discards whatever is in flight when a reply is lost so later replies are
+not mistaken for it.
+
+AsyncSerialTransport does the same for asyncio; it reads from the serial
+port's file descriptor when the event loop reports it readable so any number
+of ports can share one thread.
+
+License
+--------
+Apache 2.0 License (See Also LICENSE file)
+
+Author
+--------
+Tom Egan <tom@tomegan.tech>
+'''
+
+class FrameParser:
+    '''
+    Incrementally split a stream of bytes into frames terminated by ASCII 13
+    (\\r) or ASCII 0 (\\0). The terminator is not included in the frame.
+    '''
+
+    _terminator = re.compile(b'[\r\0]')
+
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._frames = deque()
+        self._times = deque()
+        # the time the terminator of the frame last popped was received
+        self.last_time = None
+
+
+    def __len__(self):
+        '''
+        The number of complete frames waiting to be popped
+        '''
+        return len(self._frames)
+
+
+    def feed(self, data, received=None, byte_time=0.0):
+        '''
+        Add bytes received from the serial port to the parser
+
+        Parameters
+        --------
+        data : bytes
+            the bytes read from the serial port, may contain any number of
+            complete or partial frames
+        received : float
+            optionally the time, as from time.monotonic(), data was read.
+            Each frame completed is given the time its terminator arrived
+            assuming the bytes after it arrived back to back
+        byte_time : float
+            seconds taken to transmit one byte over the serial link
+        '''
+        self._pending += data
+        if self._terminator.search(data) is None:
+            return
+
+        parts = self._terminator.split(self._pending)
+        self._pending = bytearray(parts.pop())
+        self._frames.extend(parts)
+        if received is None:
+            self._times.extend([None] * len(parts))
+        else:
+            last = len(data) - 1
+            self._times.extend(received - (last - match.start()) * byte_time
+                               for match in self._terminator.finditer(data))
+
+
+    def pop(self):
+        '''
+        Get the oldest complete frame
+
+        Returns
+        --------
+        bytes - the frame or None if no complete frame has been received
+        '''
+        if self._frames:
+            self.last_time = self._times.popleft()
+            return self._frames.popleft()
+        return None
+
+
+    def flush(self):
+        '''
+        Get and discard any bytes which have been received but are not yet
+        terminated. Used when a read times out part way through a reply.
+
+        Returns
+        --------
+        bytes - the unterminated bytes, possibly empty
+        '''
+        partial = bytes(self._pending)
+        self._pending = bytearray()
+        return partial
+
+
+    def clear(self):
+        '''
+        Discard all complete and partial frames
+        '''
+        self._pending = bytearray()
+        self._frames.clear()
+        self._times.clear()
+
+
+class ReplyTimeout(IOError):
+    '''
+    Raised when a controller doesn't reply in time, or when a reply is
+    discarded to resynchronise with the controller
+    '''
+
+
+class CommandStatistics:
+    '''
+    Counters describing the serial traffic caused by a single command
+    mnemonic e.g. b'RL'
+
+    port_calls counts the calls made into the serial port (write, read and
+    queries of the number of bytes waiting). Each maps to one or two system
+    calls in pyserial so it is a good proxy for the syscall cost of a command.
+    '''
+
+    __slots__ = ("count", "bytes_written", "bytes_read", "port_calls")
+
+
+    def __init__(self):
+        self.count = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.port_calls = 0
+
+
+    def as_dict(self):
+        '''
+        Get the counters along with per command averages as a dictionary
+        '''
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "bytes_written": self.bytes_written,
+            "bytes_read": self.bytes_read,
+            "port_calls": self.port_calls,
+            "bytes_per_command": (self.bytes_written + self.bytes_read) / count,
+            "port_calls_per_command": self.port_calls / count
+        }
+
+
+class SerialTransport:
+    '''
+    Send commands to and receive replies from a load frame controller over an
+    open serial port
+
+    Each batch of commands is sent with a single write and replies are read
+    in bulk. One thread may receive while others send, as CommandChannel
+    does for urgent commands: writes and the bookkeeping of replies awaited
+    and received are guarded by a lock which is never held while blocked
+    reading the port. Receiving from more than one thread at once is not
+    supported.
+    '''
+
+    terminator = b'\r'
+
+
+    def __init__(self, communication_port, byte_time=0.0):
+        '''
+        Parameters
+        --------
+        communication_port : serial.Serial
+            an open serial port with a read timeout set
+        byte_time : float
+            seconds taken to transmit one byte over the serial link, used to
+            estimate when each reply arrived
+        '''
+        self.communication_port = communication_port
+        self.byte_time = byte_time
+        # the time, as from time.monotonic(), the last reply received was
+        # completed
+        self.last_reply_time = None
+        self._parser = FrameParser()
+        self._awaiting_reply = deque()
+        self._statistics = {}
+        self._lock = Lock()  # guards all of the above, see the class docstring
+
+
+    def _statistics_for(self, command):
+        mnemonic = bytes(command[:2])
+        statistics = self._statistics.get(mnemonic)
+        if statistics is None:
+            statistics = self._statistics[mnemonic] = CommandStatistics()
+        return statistics
+
+
+    def send(self, *commands):
+        '''
+        Send one or more commands in a single write
+
+        Parameters
+        --------
+        commands : bytes
+            the commands including any arguments but excluding the
+            terminating \\r e.g. b'RL' or b'WV12.5'
+        '''
+        with self._lock:
+            # written under the lock so replies are awaited in write order
+            self.communication_port.write(
+                self.terminator.join(commands) + self.terminator)
+
+            for index, command in enumerate(commands):
+                statistics = self._statistics_for(command)
+                statistics.count += 1
+                statistics.bytes_written += len(command) + 1
+                if 0 == index:
+                    statistics.port_calls += 1
+                self._awaiting_reply.append(statistics)
+
+
+    def receive(self, timeout=None):
+        '''
+        Get the next reply from the controller
+
+        Parameters
+        --------
+        timeout : float
+            if given, seconds to wait for each read from the port instead
+            of the port's own timeout, and ReplyTimeout is raised if the
+            port times out
+
+        Returns
+        --------
+        bytes - the reply without its terminator. If the port times out
+            before a complete reply is received whatever was received, which
+            may be nothing, is returned; mimicking a byte at a time read.
+
+        Raises
+        --------
+        ReplyTimeout - if a timeout is given and the port times out
+        '''
+        with self._lock:
+            # reconfigures the port so not while another thread writes
+            if timeout is not None and timeout != self.communication_port.timeout:
+                self.communication_port.timeout = timeout
+            frame = self._parser.pop()
+
+        port_calls = 0
+        bytes_read = 0
+        while frame is None:
+            # the lock isn't held while blocked so senders aren't delayed
+            waiting = self.communication_port.in_waiting
+            data = self.communication_port.read(waiting or 1)
+            port_calls += 2
+            with self._lock:
+                if not data:
+                    frame = self._parser.flush()
+                    self._parser.last_time = monotonic()
+                    if timeout is not None:
+                        if self._awaiting_reply:
+                            self._awaiting_reply.popleft().port_calls += port_calls
+                        raise ReplyTimeout("No reply within {:.3f} s; received {!r}".format(
+                            timeout, frame))
+                    break
+                bytes_read += len(data)
+                self._parser.feed(data, monotonic(), self.byte_time)
+                frame = self._parser.pop()
+
+        with self._lock:
+            self.last_reply_time = self._parser.last_time
+            if self._awaiting_reply:
+                statistics = self._awaiting_reply.popleft()
+                statistics.port_calls += port_calls
+                statistics.bytes_read += bytes_read
+        return frame
+
+
+    def reset_input(self):
+        '''
+        Discard any buffered or partially received replies
+        '''
+        with self._lock:
+            self.communication_port.reset_input_buffer()
+            self._parser.clear()
+            self._awaiting_reply.clear()
+
+
+    def statistics(self):
+        '''
+        Get per command traffic counters
+
+        Returns
+        --------
+        dict - mapping command mnemonic e.g. "RL" to a dictionary of counters
+            see CommandStatistics.as_dict
+        '''
+        with self._lock:
+            return {mnemonic.decode('ascii', 'replace'): statistics.as_dict()
+                    for mnemonic, statistics in self._statistics.items()}
+
+
+    def reset_statistics(self):
+        '''
+        Zero all per command traffic counters
+        '''
+        with self._lock:
+            self._statistics.clear()
+
+
+Exchange = namedtuple("Exchange", ("submitted", "sent", "received", "replies", "reply_times"))
+Exchange.__doc__ = '''
+The replies to a batch of commands sent through a CommandChannel along with
+the times, as from time.monotonic(), the batch was submitted, written to the
+serial port and its last reply received, and the estimated time each reply's
+terminator arrived
+'''
+
+
+class RoundTripEstimator:
+    '''
+    Estimate how long to wait for a reply from measured round trip times
+
+    The smoothed round trip time and its mean deviation are updated as in TCP
+    (RFC 6298) and the timeout is the smoothed time plus four deviations,
+    rounded up to a multiple of granularity so the port isn't reconfigured
+    for every small change, and kept between minimum and maximum.
+    '''
+
+    alpha = 1 / 8
+    beta = 1 / 4
+    granularity = 0.005
+
+
+    def __init__(self, initial=1.0, minimum=0.05, maximum=1.0):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.smoothed = None
+        self.variation = None
+
+
+    def record(self, round_trip):
+        '''
+        Update the estimate with a round trip time, in seconds, of an
+        exchange which was not retried
+        '''
+        if self.smoothed is None:
+            self.smoothed = round_trip
+            self.variation = round_trip / 2
+        else:
+            self.variation += self.beta * (abs(self.smoothed - round_trip) - self.variation)
+            self.smoothed += self.alpha * (round_trip - self.smoothed)
+
+
+    def backoff(self):
+        '''
+        Wait longer after a timeout in case the controller has become slower
+        '''
+        if self.smoothed is not None:
+            self.variation = min(2 * self.variation, self.maximum)
+
+
+    def timeout(self):
+        if self.smoothed is None:
+            return self.initial
+        timeout = self.smoothed + 4 * self.variation
+        timeout = self.granularity * -(-timeout // self.granularity)
+        return min(self.maximum, max(self.minimum, timeout))
+
+
+class CommandChannel:
+    '''
+    Own a SerialTransport on behalf of any number of threads
+
+    Commands are queued by priority, then in the order submitted, and sent by
+    the channel's thread which is the only one to read from the serial port.
+    Urgent commands e.g. stop are not queued but written at once from the
+    submitting thread, behind any batch whose replies are still awaited, so
+    they reach the controller without waiting for a reply which may be slow
+    or lost; SerialTransport allows this while the channel's thread is
+    receiving. Their replies are still matched in the order commands were
+    written.
+
+    The time from submitting each urgent command to receiving its reply is
+    kept so stop latency can be reported.
+
+    Replies are awaited for a time estimated from recent round trips. When
+    one doesn't arrive, or resync() is called because a reply was garbled,
+    every batch in flight fails with ReplyTimeout once the line has been
+    quiet for a moment and any input is discarded; callers may then resend.
+    '''
+
+    URGENT = 0
+    NORMAL = 1
+    POLL = 2
+
+    # how many recent urgent command latencies to keep
+    latency_history = 1000
+
+
+    def __init__(self, transport):
+        '''
+        Parameters
+        --------
+        transport : SerialTransport
+            the transport, which no one else may use once the channel is
+            created
+        '''
+        self.transport = transport
+        self.urgent_latencies = deque(maxlen=self.latency_history)
+        self.round_trip = RoundTripEstimator()
+        self.timeouts = 0
+        self.resyncs = 0
+        self._resync_requested = False
+        self._condition = Condition()
+        self._queue = []  # heap of (priority, sequence, commands, future, submitted)
+        self._sequence = count()
+        self._in_flight = deque()  # of (commands, future, submitted, sent, urgent)
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def submit(self, commands, priority=NORMAL):
+        '''
+        Send a batch of commands as soon as their priority allows
+
+        Parameters
+        --------
+        commands : tuple
+            of bytes, each a command excluding the terminating \\r
+        priority : int
+            URGENT, NORMAL or POLL
+
+        Returns
+        --------
+        concurrent.futures.Future - resolving to an Exchange
+        '''
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._condition:
+            if self._closed:
+                raise IOError("The command channel is closed")
+            submitted = monotonic()
+            if self.URGENT == priority:
+                self._send(commands, future, submitted, True)
+            else:
+                heapq.heappush(self._queue,
+                               (priority, next(self._sequence), commands, future, submitted))
+            self._condition.notify()
+        return future
+
+
+    def call(self, *commands, priority=NORMAL, timeout=None):
+        '''
+        Send commands and wait for their replies
+
+        Parameters
+        --------
+        timeout : float
+            seconds to wait for the channel's thread, or None to wait as
+            long as it takes; replies are timed out by the thread itself so
+            this only matters if the thread may not be running
+
+        Returns
+        --------
+        Exchange
+
+        Raises
+        --------
+        concurrent.futures.TimeoutError - if the timeout passes first
+        '''
+        return self.submit(commands, priority).result(timeout)
+
+
+    def running(self):
+        '''
+        Whether the channel's thread is alive to send commands and read
+        replies; it is not e.g. once the interpreter has begun to exit
+        '''
+        return not self._closed and self._thread is not None and self._thread.is_alive()
+
+
+    def close(self, timeout=None):
+        '''
+        Fail anything still queued and stop the channel's thread once
+        replies already awaited are received
+
+        Parameters
+        --------
+        timeout : float
+            seconds to wait for the thread to stop, or None to wait as long
+            as it takes
+        '''
+        with self._condition:
+            self._closed = True
+            while self._queue:
+                heapq.heappop(self._queue)[3].set_exception(IOError("The command channel is closed"))
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+    def resync(self):
+        '''
+        Ask the channel to discard what it has received and fail everything
+        in flight e.g. because a reply couldn't be decoded, which suggests
+        replies and commands are no longer matched
+        '''
+        with self._condition:
+            self._resync_requested = True
+            self._condition.notify()
+
+
+    def statistics(self):
+        '''
+        Get counters describing the health of the link
+
+        Returns
+        --------
+        dict - of timeouts, resyncs and the round trip estimate in seconds
+        '''
+        return {
+            "timeouts": self.timeouts,
+            "resyncs": self.resyncs,
+            "smoothed_round_trip": self.round_trip.smoothed,
+            "round_trip_variation": self.round_trip.variation,
+            "reply_timeout": self.round_trip.timeout()
+        }
+
+
+    def stop_latency(self, percentile=99):
+        '''
+        Get a percentile of the recent submit to reply times of urgent
+        commands, in seconds, or None if none have been sent
+        '''
+        ordered = sorted(self.urgent_latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))]
+
+
+    def _send(self, commands, future, submitted, urgent):
+        # called with the condition held so writes and _in_flight agree
+        try:
+            self.transport.send(*commands)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self._in_flight.append((commands, future, submitted, monotonic(), urgent))
+
+
+    def _run(self):
+        '''
+        Intended to be run as a thread
+        '''
+        while True:
+            with self._condition:
+                while (not self._in_flight and not self._queue and not self._closed
+                       and not self._resync_requested):
+                    self._condition.wait()
+                resync = self._resync_requested
+            if resync:
+                self._resync()
+                continue
+            with self._condition:
+                if not self._in_flight:
+                    if not self._queue:
+                        return  # closed
+                    _priority, _sequence, commands, future, submitted = heapq.heappop(self._queue)
+                    self._send(commands, future, submitted, False)
+                    continue
+                commands, future, submitted, sent, urgent = self._in_flight[0]
+
+            # urgent commands may be written while we wait here
+            try:
+                timeout = self.round_trip.timeout()
+                replies = []
+                reply_times = []
+                for _command in commands:
+                    replies.append(self.transport.receive(timeout))
+                    reply_times.append(self.transport.last_reply_time)
+            except ReplyTimeout:
+                self.timeouts += 1
+                self.round_trip.backoff()
+                self._resync()
+                continue
+            except Exception as e:
+                with self._condition:
+                    self._in_flight.popleft()
+                future.set_exception(e)
+                continue
+            received = monotonic()
+            with self._condition:
+                self._in_flight.popleft()
+            self.round_trip.record(received - sent)
+            if urgent:
+                self.urgent_latencies.append(received - submitted)
+            future.set_result(Exchange(submitted, sent, received, replies, reply_times))
+
+
+    def _resync(self):
+        # wait for the line to go quiet, so late replies to what is in
+        # flight are not taken for replies to what is sent next, then discard
+        # everything
+        self.resyncs += 1
+        quiet = self.round_trip.timeout()
+        try:
+            for _attempt in range(3):
+                sleep(quiet)
+                if not self.transport.communication_port.in_waiting:
+                    break
+                self.transport.communication_port.reset_input_buffer()
+        except Exception:
+            pass  # a failed port is reported to whatever is sent next
+        with self._condition:
+            self._resync_requested = False
+            try:
+                self.transport.reset_input()
+            except Exception:
+                pass
+            in_flight, self._in_flight = self._in_flight, deque()
+        for _commands, future, _submitted, _sent, _urgent in in_flight:
+            future.set_exception(ReplyTimeout("Discarded to resynchronise with the controller"))
+
+
+class AsyncSerialTransport:
+    '''
+    Send commands to and receive replies from a load frame controller from
+    an asyncio event loop
+
+    Replies are matched to commands in the order the commands were sent so
+    several tasks may have commands outstanding at once.
+    '''
+
+    terminator = b'\r'
+
+
+    def __init__(self, communication_port, timeout=1.0):
+        '''
+        Must be called from a coroutine or callback running in the event
+        loop the transport will be used with
+
+        Parameters
+        --------
+        communication_port : serial.Serial
+            an open serial port with a read timeout of 0 i.e. non-blocking
+        timeout : float
+            seconds to wait for each reply
+        '''
+        self.communication_port = communication_port
+        self.timeout = timeout
+        self._loop = asyncio.get_running_loop()
+        self._fd = communication_port.fileno()
+        self._parser = FrameParser()
+        self._awaiting_reply = deque()  # of (CommandStatistics, Future)
+        self._statistics = {}
+        self._resyncing = None  # a Future done when a resync finishes
+        self.timeouts = 0
+        self.resyncs = 0
+        self._loop.add_reader(self._fd, self._data_received)
+
+
+    def close(self):
+        '''
+        Stop reading from the port; any outstanding commands fail
+        '''
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        self._fail(ConnectionError("Transport closed"))
+
+
+    def _statistics_for(self, command):
+        mnemonic = bytes(command[:2])
+        statistics = self._statistics.get(mnemonic)
+        if statistics is None:
+            statistics = self._statistics[mnemonic] = CommandStatistics()
+        return statistics
+
+
+    def _fail(self, error):
+        while self._awaiting_reply:
+            _statistics, future = self._awaiting_reply.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+
+    def _data_received(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            # e.g. the adapter was unplugged
+            self._fail(e)
+            self.close()
+            return
+        if not data:
+            self.close()
+            return
+
+        if self._awaiting_reply:
+            self._awaiting_reply[0][0].port_calls += 1
+        self._parser.feed(data)
+        frame = self._parser.pop()
+        while frame is not None:
+            if self._awaiting_reply:
+                statistics, future = self._awaiting_reply.popleft()
+                statistics.bytes_read += len(frame) + 1
+                if not future.done():
+                    future.set_result(frame)
+            frame = self._parser.pop()
+
+
+    async def command(self, *commands):
+        '''
+        Send one or more commands in a single write and wait for the replies
+
+        Parameters
+        --------
+        commands : bytes
+            the commands including any arguments but excluding the
+            terminating \\r e.g. b'RL' or b'WV12.5'
+
+        Returns
+        --------
+        list - of the replies, as bytes without terminators, in the order of
+            the commands
+
+        Raises
+        --------
+        TimeoutError - if a reply doesn't arrive in time; the input is then
+            discarded and every other command awaiting a reply fails too,
+            so a late reply can't be taken for the reply to a later command
+        ConnectionError - if the transport is closed
+        '''
+        if self._resyncing is not None:
+            await asyncio.shield(self._resyncing)
+        if self._fd is None:
+            raise ConnectionError("Transport closed")
+
+        pending = []
+        for index, command in enumerate(commands):
+            statistics = self._statistics_for(command)
+            statistics.count += 1
+            statistics.bytes_written += len(command) + 1
+            if 0 == index:
+                statistics.port_calls += 1
+            entry = (statistics, self._loop.create_future())
+            self._awaiting_reply.append(entry)
+            pending.append(entry)
+        self.communication_port.write(self.terminator.join(commands) + self.terminator)
+
+        replies = []
+        for entry in pending:
+            try:
+                replies.append(await asyncio.wait_for(asyncio.shield(entry[1]), self.timeout))
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                for _statistics, future in pending:
+                    future.cancel()
+                await self._resync()
+                raise TimeoutError("No reply from the controller within {} s".format(
+                    self.timeout)) from None
+        return replies
+
+
+    async def _resync(self):
+        # as CommandChannel._resync: stop reading and wait for the line to go
+        # quiet, so late replies to what is in flight are not taken for
+        # replies to what is sent next, then discard everything
+        if self._resyncing is not None:
+            await asyncio.shield(self._resyncing)
+            return
+        self._resyncing = self._loop.create_future()
+        self.resyncs += 1
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+        try:
+            for _attempt in range(3):
+                await asyncio.sleep(self.timeout)
+                if not self.communication_port.in_waiting:
+                    break
+                self.communication_port.reset_input_buffer()
+            self.communication_port.reset_input_buffer()
+        except Exception:
+            pass  # a failed port is reported to whatever is sent next
+        finally:
+            self._parser.clear()
+            self._fail(TimeoutError("Discarded to resynchronise with the controller"))
+            if self._fd is not None:
+                self._loop.add_reader(self._fd, self._data_received)
+            self._resyncing.set_result(None)
+            self._resyncing = None
+
+
+    def reset_input(self):
+        '''
+        Discard any buffered or partially received replies
+        '''
+        self.communication_port.reset_input_buffer()
+        self._parser.clear()
+        self._fail(ConnectionResetError("Input discarded"))
+
+
+    def statistics(self):
+        '''
+        Get per command traffic counters
+
+        Returns
+        --------
+        dict - mapping command mnemonic e.g. "RL" to a dictionary of counters
+            see CommandStatistics.as_dict
+        '''
+        return {mnemonic.decode('ascii', 'replace'): statistics.as_dict()
+                for mnemonic, statistics in self._statistics.items()}
+
+
+    def reset_statistics(self):
+        '''
+        Zero all per command traffic counters
+        '''
+        self._statistics.clear()
@@ -0,0 +1,27 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+import importlib.util
+import os
+import sys
+
+'''
+Make src importable as load_frame_controller, the name meson installs it
+under, so tests run from a checkout without building
+'''
+
+_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+if "load_frame_controller" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location("load_frame_controller",
+        os.path.join(_source, "__init__.py"), submodule_search_locations=[_source])
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules["load_frame_controller"] = _module
+    _spec.loader.exec_module(_module)
@@ -0,0 +1,68 @@
+#####################################################################
+# Copyright 2020 Tom Egan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#####################################################################
+
+# Import from Python Standard Library
+from threading import Event, Lock, Thread
+import unittest
+
+# Import from our module
+from load_frame_controller.instrumentation import Registry
+
+'''
+Tests for the instrumentation registry
+'''
+
+class LockedTest(unittest.TestCase):
+
+    def test_toggling_between_samples(self):
+        # as the statistics window does while the poll thread appends
+        registry = Registry()
+        lock = Lock()
+        samples = []
+        for index in range(10):
+            registry.enabled = bool(index % 2)
+            with registry.locked(lock, "lock_wait"):
+                samples.append(index)
+            self.assertFalse(lock.locked())
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(registry.histogram("lock_wait").count, 5)
+
+
+    def test_toggling_while_waiting(self):
+        # enabling while the lock is awaited mustn't break the block
+        registry = Registry()
+        lock = Lock()
+        entered = Event()
+
+        def append():
+            with registry.locked(lock, "lock_wait"):
+                entered.set()
+
+        lock.acquire()
+        thread = Thread(target=append)
+        thread.start()
+        registry.enabled = True
+        lock.release()
+        thread.join(5)
+        self.assertTrue(entered.is_set())
+        self.assertFalse(lock.locked())
+
+
+    def test_released_on_error(self):
+        registry = Registry(enabled=True)
+        lock = Lock()
+        with self.assertRaises(KeyError):
+            with registry.locked(lock, "lock_wait"):
+                raise KeyError()
+        self.assertFalse(lock.locked())
+
+
+if __name__ == '__main__':
+    unittest.main()